@@ -29,9 +29,41 @@ else:
         },
         "regression":{
             "start": 0.001,
-            "end": 0.01           
+            "end": 0.01,
+            "auto": False,
+            "auto_min_width": 0.005,
+            "auto_max_strain": 0.05,
+            "auto_steps": 40
         },
         "integration":{
             "method": "simps"
+        },
+        "cache":{
+            "curve_store_mb": 256,
+            "sidecar": True,
+            "analysis_store_mb": 16
+        },
+        "parallel":{
+            "workers": None
+        },
+        "history":{
+            "max_depth": 1000,
+            "max_memory_mb": 64
+        },
+        "project":{
+            "embed": True,
+            "compress": False
+        },
+        "journal":{
+            "enabled": True,
+            "compact_after": 500
+        },
+        "export":{
+            "dpi": 300,
+            "format": "png"
+        },
+        "plot":{
+            "collection_threshold": 50,
+            "legend_group": "curve"
         }
     }
\ No newline at end of file
@@ -7,12 +7,31 @@ import logging
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 import math
 import json
 import uuid
+import glob
+import hashlib
+import zipfile
+import struct
+import warnings
+import threading
+import multiprocessing
+import queue
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from enum import Enum
 import config
 
+ANALYSIS_CHUNK_SIZE = 2**18  # Amount of points packed in one buffer by analyze_curves()
+METRIC_NAMES = ['ym', 'uts', 'sams', 'sab', 'toughness']    # Analysis values returned by analyze_curves()
 
 # Helper functions: functions that accepts a procecced stress/strain data array
 def calculate(array, dimensions):  
@@ -52,7 +71,6 @@ def linear_regression(array, from_to = (0, 0)):
 
     start_idx = idx_of_nearest(array[:, 1], range[0])
     end_idx = idx_of_nearest(array[:, 1], range[1])
-    print(range)
 
     # logger.debug("From, to: %d, %d" % (start_idx, end_idx))
 
@@ -97,6 +115,7 @@ def idx_of_nearest(array_1d, target):
     '''
     Find the index of value nearest to target in a 1d array.
     Only 1d array should be given as param; otherwise would not give correct result
+    For repeated lookups on the same strain array, use Strain_lookup, which gives the same results in about O(log n)
     '''
 
     return (np.abs(array_1d - target)).argmin()
@@ -117,23 +136,539 @@ def integrate_x(array):
     except Exception as e:
         print(e)
 
+def decimate_curve(array, bins, x_range = None):
+
+    '''
+    Reduce a curve to a few points per bin for display. Rows are split into bins of equal row counts, and the first, last, lowest and highest (in both stress and strain) point of every bin are kept in their original order, so the drawn line looks the same as the full curve at a resolution of about bins pixels. The curve is never changed, only a subset of its rows is returned, so it must not be used for analysis.
+
+    array: np.array([[stress, strain], ...])
+    bins: int, amount of bins, usually the width of the plot in pixels
+    x_range: tuple, (min, max) of strain, optional. If given, only the part of the curve within this range, plus one point on each side, is decimated and returned.
+
+    Return value: np.array, rows of array. Returned as is if it has no more than 6 rows per bin.
+    '''
+
+    if x_range != None:
+        inside = np.flatnonzero((array[:, 1] >= x_range[0]) & (array[:, 1] <= x_range[1]))
+        if len(inside) > 0:
+            array = array[max(inside[0] - 1, 0): inside[-1] + 2]
+
+    row_count = len(array)
+    bins = max(int(bins), 1)
+    if row_count <= 6 * bins:
+        return array
+
+    # Split rows into full bins of bin_size rows, rows left over are kept as they are
+    bin_size = -(-row_count // bins)
+    full_bins = row_count // bin_size
+    offsets = np.arange(full_bins) * bin_size
+    picks = [offsets, offsets + bin_size - 1, np.arange(full_bins * bin_size, row_count)]
+    for column in range(2):
+        values = array[:full_bins * bin_size, column].reshape(full_bins, bin_size)
+        picks.append(offsets + values.argmin(axis=1))
+        picks.append(offsets + values.argmax(axis=1))
+
+    # np.unique() also sorts the rows back to their original order
+    return array[np.unique(np.concatenate(picks))]
+
+def segment_first(mask, ends):
+
+    '''
+    Find the position of the first True value in each segment of a 1d bool array
+
+    mask: 1d bool array, concatenated segments
+    ends: 1d int array, ending position (exclusive) of each segment
+
+    Return value: tuple, (segments, positions), the segments having a True value, and the position of their first True value
+    '''
+
+    positions = np.flatnonzero(mask)
+    segments = np.searchsorted(ends, positions, side='right')
+    first = np.flatnonzero(np.diff(segments, prepend=-1))
+    return segments[first], positions[first]
+
+def _nan_average(array):
+
+    '''
+    Average of the values of array that are not NaN, NaN if there are none
+    '''
+
+    array = array[~np.isnan(array)]
+    return np.average(array) if len(array) > 0 else np.nan
+
+def _nan_std(array):
+
+    '''
+    Standard deviation of the values of array that are not NaN, NaN if there are none
+    '''
+
+    array = array[~np.isnan(array)]
+    return np.std(array) if len(array) > 0 else np.nan
+
+def analyze_curves(curves, regression_indices = None):
+
+    '''
+    Calculate analysis values of many stress/strain curves at once.
+
+    All curves are packed in one buffer with offsets, and each value is calculated for all curves with a few segmented reductions. Results are the same as calculating each curve on its own with max_stress(), strain_at_break(), linear_regression() and integrate_x(), except that sums are accumulated in double precision.
+
+    curves: list of stress/strain arrays
+    regression_indices: optional, list of Regression_index objects of the curves. If given, Young's modulus is fitted with the indices instead of scanning the curves. Indices are always used if config['regression']['auto'] is True, see Regression_index.best_fit().
+    Return value: dict of 1d arrays, one value for each curve, {'ym': Young's modulus, 'uts': ultimate tensile strength, 'sams': strain at maximum stress, 'sab': strain at break, 'toughness': toughness in N/m^2}. Values are not scaled for display, except for toughness. Values of empty curves are NaN.
+    '''
+
+    result = {key: np.full(len(curves), np.nan) for key in METRIC_NAMES}
+
+    lengths = np.array([len(curve) for curve in curves], dtype=np.intp)
+    valid = np.flatnonzero(lengths > 0)
+
+    if regression_indices == None and config.config['regression'].get('auto', False) == True:
+        # The search for the most linear window needs regression indices
+        regression_indices = [Regression_index(curve) if len(curve) > 0 else None for curve in curves]
+
+    # Pack curves in chunks of about ANALYSIS_CHUNK_SIZE points, which keeps the buffers small enough to stay in CPU cache
+    chunk_ids = np.cumsum(lengths[valid]) // ANALYSIS_CHUNK_SIZE
+    for chunk in np.split(valid, np.flatnonzero(np.diff(chunk_ids)) + 1):
+        if len(chunk) == 0:
+            continue
+        chunk_result = _analyze_packed([curves[i] for i in chunk], lengths[chunk], modulus = regression_indices == None)
+        for key in chunk_result:
+            result[key][chunk] = chunk_result[key]
+
+    if regression_indices != None:
+        for i in valid:
+            result['ym'][i] = regression_indices[i].modulus(length = lengths[i])
+
+    return result
+
+def _analyze_packed(curves, lengths, modulus = True):
+
+    '''
+    Calculate analysis values of non-empty curves packed in one buffer, see analyze_curves()
+
+    modulus: bool, if False, Young's modulus is not calculated
+    '''
+
+    result = {'sams': np.full(len(curves), np.nan)}
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    stress = np.concatenate([curve[:, 0] for curve in curves])
+    strain = np.concatenate([curve[:, 1] for curve in curves])
+
+    # UTS, and strain at its first occurrence
+    uts = np.maximum.reduceat(stress, starts)
+    result['uts'] = uts
+    segments, positions = segment_first(stress == np.repeat(uts, lengths), ends)
+    result['sams'][segments] = strain[positions]
+
+    # Strain at break
+    result['sab'] = np.maximum.reduceat(strain, starts)
+
+    # Toughness: trapezoids between neighbouring points, excluding those across two curves
+    trapezoids = np.zeros(len(strain), dtype=strain.dtype)
+    np.multiply(np.diff(strain), stress[1:] + stress[:-1], out=trapezoids[:-1])
+    trapezoids[ends - 1] = 0
+    result['toughness'] = np.add.reduceat(trapezoids, starts, dtype=np.double) / 2 / config.config["axis"]["y_scaling"]
+    del trapezoids
+
+    if modulus != True:
+        return result
+
+    # Young's modulus: regression of the part of each curve between the points nearest to the regression range
+    bounds = []
+    for target in (config.config['regression']['start'], config.config['regression']['end']):
+        distance = np.abs(strain - strain.dtype.type(target))
+        segments, positions = segment_first(distance == np.repeat(np.minimum.reduceat(distance, starts), lengths), ends)
+        bound = starts.copy()
+        bound[segments] = positions
+        bounds.append(bound)
+    window_starts = bounds[0]
+    window_lengths = np.maximum(bounds[1] - bounds[0], 0)  # Empty window if end comes before start
+
+    # Gather the points in all windows, which are only a small part of the curves
+    window_ends = np.cumsum(window_lengths)
+    window_idx = np.arange(window_ends[-1]) + np.repeat(window_starts - (window_ends - window_lengths), window_lengths)
+    x = strain[window_idx].astype(np.double)
+    y = stress[window_idx].astype(np.double)
+
+    n = window_lengths.astype(np.double)
+    sums = []
+    for values in (x, y, x*y, x*x):
+        # Sums of empty windows are 0
+        segment_sums = np.zeros(len(curves))
+        non_empty = window_lengths > 0
+        if len(values) > 0:
+            segment_sums[non_empty] = np.add.reduceat(values, (window_ends - window_lengths)[non_empty])
+        sums.append(segment_sums)
+    sum_x, sum_y, sum_xy, sum_xx = sums
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['ym'] = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+
+    return result
+
+def parse_data_table(text):
+
+    '''
+    Parse a sample data table of a Shimadzu .csv file into a float array of [force, stroke]
+
+    text: string, the data table. The first 3 rows are titles and units; columns 1 and 2 are force and stroke.
+    Return value: np.array of np.single, with shape (n, 2)
+    '''
+
+    lines = text.splitlines()[3:]
+    if lines == []:
+        raise ValueError("Empty data table")
+
+    # Fast path: a table of plain numbers with the same amount of columns in every row
+    column_count = lines[0].count(',') + 1
+    if '"' not in text:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # Invalid tables are detected by their size below
+            values = np.fromstring(','.join(lines), dtype=np.double, sep=',')
+        if values.size == column_count * len(lines):
+            return values.reshape(-1, column_count)[:, 1:3].astype(np.single)
+
+    # Fallback for quoted or irregular tables
+    return np.array([row[1:3] for row in csv.reader(lines)], dtype=np.single)
+
+SIDECAR_VERSION = 1   # Version of the layout of binary sidecar files, bump when the layout changes
+PROJECT_VERSION = 3   # Version of binary project files, JSON snapshot files are version 1 and 2
+PROJECT_EXTENSION = '.tentackle'  # File extension of binary project files
+JOURNAL_SUFFIX = '.journal'   # Suffix of journal files, appended to the path of the snapshot file they belong to
+
 # Machine types
 class MachineType(Enum):
     EZ = 0  # Shimadzu EZ series
     AGSX = -1 # Shimadzu AGS-X series
 
 # Data structures
+class Strain_lookup():
+
+    '''
+    Nearest value lookup on a strain array in O(log n + d), with the same results as idx_of_nearest(), d being the amount of points below the running maximum of strain
+
+    Strain of a tensile test mostly grows, with a few dips from noise. Points at the running maximum (envelope) of strain form a non-decreasing sequence, which is binary searched, and only the points in dips below it are scanned.
+    '''
+
+    def __init__(self, strain):
+        super().__init__()
+
+        self.strain = strain
+        envelope = np.maximum.accumulate(strain)
+
+        # Points at the envelope are non-decreasing, the others are dips below it
+        self._records = np.flatnonzero(strain >= envelope)
+        self._record_values = strain[self._records]
+        self._dips = np.flatnonzero(strain < envelope)
+        self._dip_values = strain[self._dips]
+
+    @property
+    def nbytes(self):
+        return self.strain.nbytes + self._records.nbytes + self._record_values.nbytes + self._dips.nbytes + self._dip_values.nbytes
+
+    def nearest(self, target, length = None):
+
+        '''
+        Find the index of the strain value nearest to target. On a tie, the earlier index is returned.
+
+        length: only search the first `length` points, for truncated curves
+        '''
+
+        length = len(self.strain) if length == None else min(length, len(self.strain))
+        target = self.strain.dtype.type(target)
+        candidates = []     # (distance, index)
+
+        record_count = int(np.searchsorted(self._records, length, side='left'))
+        if record_count > 0:
+            values = self._record_values[:record_count]
+            # Binary search, then the first occurrences of the values on both sides of target
+            upper = int(np.searchsorted(values, target, side='left'))
+            if upper < record_count:
+                candidates.append((abs(values[upper] - target), int(self._records[upper])))
+            if upper > 0:
+                lower = int(np.searchsorted(values, values[upper - 1], side='left'))
+                candidates.append((abs(values[lower] - target), int(self._records[lower])))
+
+        dip_count = int(np.searchsorted(self._dips, length, side='left'))
+        if dip_count > 0:
+            dip = int(np.abs(self._dip_values[:dip_count] - target).argmin())
+            candidates.append((abs(self._dip_values[dip] - target), int(self._dips[dip])))
+
+        return min(candidates)[1]
+
+
+class Regression_index():
+
+    '''
+    Prefix sums of a stress/strain curve, for linear regression over any strain window in O(1)
+
+    The index of a curve also serves every truncation of it, as a truncated curve is a prefix of the curve.
+    '''
+
+    def __init__(self, array):
+        super().__init__()
+
+        x = array[:, 1].astype(np.double)
+        y = array[:, 0].astype(np.double)
+
+        # Prefix sums of x, y, xy, x^2, y^2. They start with 0, so the sum of [start, end) is prefix[end] - prefix[start]
+        self._sums = np.zeros((5, len(array) + 1))
+        for row, values in enumerate((x, y, x*y, x*x, y*y)):
+            np.cumsum(values, out=self._sums[row, 1:])
+
+        self.lookup = Strain_lookup(array[:, 1])
+
+    @property
+    def nbytes(self):
+        return self._sums.nbytes + self.lookup.nbytes
+
+    def nearest(self, target, length = None):
+
+        '''
+        Find the index of the strain value nearest to target, see Strain_lookup.nearest()
+        '''
+
+        return self.lookup.nearest(target, length)
+
+    def fit(self, from_to = None, length = None):
+
+        '''
+        Linear regression of the part of the curve between the points nearest to a strain window, see linear_regression()
+
+        from_to: tuple, (from_x_equals_to_value, to_x_equals_to_value). If None, follows config['regression'].
+        length: only use the first `length` points, for truncated curves
+
+        Return value: tuple, (slope, intercept)
+        '''
+
+        if from_to == None:
+            from_to = (config.config['regression']['start'], config.config['regression']['end'])
+
+        start_idx = self.nearest(from_to[0], length)
+        end_idx = self.nearest(from_to[1], length)
+
+        n = end_idx - start_idx
+        if n < 2:
+            # No line can be fitted through less than 2 points
+            return np.nan, np.nan
+        sum_x, sum_y, sum_xy, sum_xx, sum_yy = self._sums[:, end_idx] - self._sums[:, start_idx]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.double(n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+            intercept = (sum_y - slope * sum_x) / np.double(n)
+
+        return slope, intercept
+
+
+    def best_fit(self, min_width = None, max_strain = None, steps = None, length = None):
+
+        '''
+        Find the most linear strain window, and fit it
+
+        Candidate windows start and end on a grid of `steps` + 1 strain values from 0 to `max_strain`, and are at least `min_width` wide. All candidates are evaluated at once with the prefix sums, and the one with the highest R^2 is picked.
+
+        min_width, max_strain, steps: if None, follow config['regression']['auto_min_width'], ['auto_max_strain'], ['auto_steps']
+        length: only use the first `length` points, for truncated curves
+
+        Return value: tuple, (slope, intercept, (from_x_equals_to_value, to_x_equals_to_value), r_squared). All NaN if no window can be fitted.
+        '''
+
+        settings = config.config['regression']
+        if min_width == None:
+            min_width = settings.get('auto_min_width', 0.005)
+        if max_strain == None:
+            max_strain = settings.get('auto_max_strain', 0.05)
+        if steps == None:
+            steps = settings.get('auto_steps', 40)
+
+        grid = np.linspace(0, max_strain, steps + 1)
+        bounds = np.array([self.nearest(strain, length) for strain in grid])
+
+        # Every pair of grid points wide enough is a candidate
+        start, end = np.triu_indices(len(grid), 1)
+        wide_enough = grid[end] - grid[start] >= min_width * (1 - 1e-9)
+        start, end = start[wide_enough], end[wide_enough]
+
+        n = (bounds[end] - bounds[start]).astype(np.double)
+        sum_x, sum_y, sum_xy, sum_xx, sum_yy = self._sums[:, bounds[end]] - self._sums[:, bounds[start]]
+        covariance = n * sum_xy - sum_x * sum_y
+        variance_x = n * sum_xx - sum_x ** 2
+        variance_y = n * sum_yy - sum_y ** 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_squared = np.where((n >= 3) & (variance_x > 0) & (variance_y > 0), covariance ** 2 / (variance_x * variance_y), np.nan)
+
+        if np.all(np.isnan(r_squared)):
+            return np.nan, np.nan, (np.nan, np.nan), np.nan
+
+        best = np.nanargmax(r_squared)
+        slope = covariance[best] / variance_x[best]
+        intercept = (sum_y[best] - slope * sum_x[best]) / n[best]
+
+        return slope, intercept, (grid[start[best]], grid[end[best]]), r_squared[best]
+
+    def modulus(self, length = None):
+
+        '''
+        Young's modulus of the curve, with the regression window set in config['regression']: the most linear window if config['regression']['auto'] is True, otherwise the fixed window from 'start' to 'end'
+        '''
+
+        if config.config['regression'].get('auto', False) == True:
+            return self.best_fit(length = length)[0]
+        return self.fit(length = length)[0]
+
+
+class LRU_store():
+
+    '''
+    A bounded key-value store with least-recently-used eviction, for keeping processed data in memory. Safe to use from multiple threads.
+
+    max_bytes: int, total size budget of stored values in bytes; values are measured by `nbytes` if available
+    max_items: int, maximum amount of stored values, None for no limit
+    '''
+
+    def __init__(self, max_bytes, max_items = None):
+        super().__init__()
+
+        self._store = OrderedDict()     # Stored values, from least recently used to most recently used
+        self._sizes = {}    # Size of each stored value in bytes
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._store)
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __getstate__(self):
+
+        # Locks can not be pickled, which is needed for sending tables from worker processes, see load_tables()
+        with self._lock:
+            state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def stats(self):
+
+        '''
+        Return a dict of usage statistics of the store
+        '''
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'items': len(self._store),
+            'bytes': self.bytes
+        }
+
+    def get(self, key, default = None):
+
+        '''
+        Look up a value, and mark it as the most recently used one
+        '''
+
+        with self._lock:
+            if key in self._store:
+                self._store.move_to_end(key)
+                self.hits += 1
+                return self._store[key]
+            else:
+                self.misses += 1
+                return default
+
+    def put(self, key, value):
+
+        '''
+        Store a value, then evict least recently used values until the store fits in its budget.
+        Values larger than the whole budget are not stored.
+        '''
+
+        size = getattr(value, 'nbytes', 0)
+
+        with self._lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                return
+
+            self._store[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+
+            while self.bytes > self.max_bytes or (self.max_items != None and len(self._store) > self.max_items):
+                self.pop(next(iter(self._store)))
+
+    def pop(self, key):
+
+        '''
+        Remove a value from the store, if it exists
+        '''
+
+        with self._lock:
+            if key in self._store:
+                self.bytes -= self._sizes.pop(key)
+                return self._store.pop(key)
+
+    def pop_where(self, condition):
+
+        '''
+        Remove all values whose key satisfies condition(key)
+        '''
+
+        with self._lock:
+            for key in [key for key in self._store.keys() if condition(key)]:
+                self.pop(key)
+
+    def clear(self):
+
+        '''
+        Remove all values, statistics are kept
+        '''
+
+        with self._lock:
+            self._store.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+# Processed stress/strain curves of all tables, keyed by (table_id, batch, subbatch), and their regression indices, keyed by ('regression', table_id, batch, subbatch)
+# One store per process, so config['cache']['curve_store_mb'] bounds processed curves of all open tables together. Raw data of each table is kept by the table, outside of this budget.
+_curve_store = LRU_store(config.config.get('cache', {}).get('curve_store_mb', 256) * 2**20)
+
+
 class Table:
 
     '''
     Structure for reading and keeping raw data from a single .csv file of Shimadzu EZ and AGS-X series
     '''
 
-    def __init__(self, filename, tablename = ''):
+    def __init__(self, filename, tablename = '', sidecar = None, lazy = False, embedded = None):
+
+        '''
+        filename: string, path of the .csv file
+        tablename: string, optional, name of the table. Derived from file name if not given.
+        sidecar: bool, whether to reuse/write a binary sidecar file of parsed data next to the .csv file. If None, follows config['cache']['sidecar'].
+        lazy: bool, if True, only header tables are parsed when the table is opened, and data of each sample is parsed on first access. No sidecar is written in lazy mode.
+        embedded: tuple, (info, arrays) as returned by Table.export_data(). If given, the table is rebuilt from it, and the .csv file is not read at all (it does not even need to exist).
+        '''
 
         super().__init__()
         
-        self.tables = []    # Keeps all table raw infomation
+        self.headers = []   # Keeps raw infomation of header tables (metadata, dimensions), as lists of string rows
+        self._samples = {}  # Keeps stress/strain raw data of every sample, structure: {sample_number: np.array([[force, stroke], ...]), ...}
+        self._offsets = {}  # Byte ranges of sample data tables in the .csv file, structure: {sample_number: (start, end), ...}
+        self._row_counts = {}   # Amount of data rows of every sample that has both a data table and dimensions, structure: {sample_number: row_count, ...}
+        self.lazy = lazy
         self._file_name = filename
 
         # Set logger
@@ -142,18 +677,9 @@ class Table:
         # Set unique identifier for itself
         self.table_id = uuid.uuid1()
 
-        # Split multiple tables in single .csv file
-        with open(filename, newline='', encoding='Shift-JIS') as f:
-            reader = csv.reader(f)
-
-            temp_table = []
-
-            for row in reader:
-                if row != []:
-                    temp_table.append(row)
-                else:
-                    self.tables.append(temp_table)
-                    temp_table = []
+        # Processed curves of a table are of no use once the table is gone
+        table_id = self.table_id
+        weakref.finalize(self, _curve_store.pop_where, lambda key: table_id in key)
 
         # Define table name, if not specified manually
         if tablename == '':
@@ -164,34 +690,343 @@ class Table:
         # Detect intrument type from job file extension
         self.base_shift_value = 0    # Relative position of contents are different in Shimazu EZ and AGS-X series files are different
         self.machine_type = MachineType.EZ
-        if str.split(self.tables[0][1][0], '.')[-1] == "tai":
-            self.logger.debug("Shimadzu EZ series")
-        elif str.split(self.tables[0][1][0], '.')[-1] == "xtas":
-            self.logger.debug("Shimadzu AGS-X series")
-            self.base_shift_value = -1
-            self.machine_type = MachineType.AGSX
+
+        if sidecar == None:
+            sidecar = config.config.get('cache', {}).get('sidecar', True)
+
+        parsed = False
+        if embedded != None:
+            self._load_embedded(*embedded)
         else:
-            self.logger.warn("Automatic machine type interpretation failed. Default to legacy... (Shimadzu EZ series)")
-        
-        
+            # Version of the .csv file being loaded, for telling if the file has been changed afterwards
+            self.file_signature = self._file_signature()
+            self.content_hash = None    # SHA-1 of the .csv file, if it has been computed
+
+            # Reuse parsed data in sidecar file if it is still valid, otherwise parse the .csv file
+            if sidecar != True or self._load_sidecar() != True:
+                self._parse()
+                parsed = True
 
         # Find batch count and subbatch count using declared values. For AGS-X series, special routine that automatically detects the amount of samples were needed as wrong values are sometimes declared.
         # Legacy routine
-        self.batch_count = int(self.tables[2 + self.base_shift_value][1][1])
-        self.subbatch_count = int(self.tables[2 + self.base_shift_value][1][2])
+        self.batch_count = int(self.headers[2 + self.base_shift_value][1][1])
+        self.subbatch_count = int(self.headers[2 + self.base_shift_value][1][2])
 
         # AGS-X routine
         if self.machine_type == MachineType.AGSX:
-            self.batch_count = int(self.tables[1][-1][0].split(" _ ")[0])
-            self.subbatch_count = int(self.tables[1][-1][0].split(" _ ")[1])
+            self.batch_count = int(self.headers[1][-1][0].split(" _ ")[0])
+            self.subbatch_count = int(self.headers[1][-1][0].split(" _ ")[1])
 
 
         self.logger.info("Batch count: " + str(self.batch_count) + ", subbatch count: " + str(self.subbatch_count))
 
+        self._index_samples()
+
+        # Only keep a sidecar for files that have been read successfully
+        if parsed == True and sidecar == True and lazy != True:
+            self._save_sidecar()
 
         # # Init truncation records
         # self.truncation_records = [[0 for i in range(self.batch_count)] for j in range(self.subbatch_count)]
 
+    def _parse(self):
+
+        '''
+        Split multiple tables in single .csv file, by scanning the raw bytes for blank lines.
+        Header tables are kept as strings, and the byte range of every sample data table is recorded. Unless in lazy mode, sample data tables are parsed to float arrays right away.
+        '''
+
+        with open(self._file_name, 'rb') as f:
+            raw_bytes = f.read()
+
+        # Line feeds never appear inside multi-byte Shift-JIS characters, so lines can be located on raw bytes
+        byte_array = np.frombuffer(raw_bytes, dtype=np.uint8)
+        line_ends = np.flatnonzero(byte_array == ord('\n'))
+        line_starts = np.concatenate(([0], line_ends + 1))[:len(line_ends)].astype(np.intp)
+        line_lengths = line_ends - line_starts
+        blank = (line_lengths == 0) | ((line_lengths == 1) & (byte_array[line_starts] == ord('\r')))
+
+        # A table spans from the line after the previous blank line, to the blank line terminating it
+        table_start = 0
+        first_line = 0
+        for table_index, blank_line in enumerate(np.flatnonzero(blank)):
+            table_end = int(line_starts[blank_line])
+            sample_number = table_index - 3 - self.base_shift_value
+
+            if sample_number < 1:
+                rows = list(csv.reader(raw_bytes[table_start:table_end].decode('Shift-JIS').splitlines()))
+                if table_index == 0:
+                    self._detect_machine_type(rows)
+                self.headers.append(rows)
+            else:
+                self._offsets[sample_number] = (table_start, table_end)
+                # Data rows follow 3 rows of titles and units
+                self._row_counts[sample_number] = int(blank_line - first_line - 3)
+
+            table_start = int(line_ends[blank_line]) + 1
+            first_line = blank_line + 1
+
+        if self.lazy != True:
+            for sample_number, (table_start, table_end) in list(self._offsets.items()):
+                self._load_sample(sample_number, raw_bytes[table_start:table_end])
+
+    def _load_sample(self, sample_number, table_bytes = None):
+
+        '''
+        Parse the data table of a sample into a float array of [force, stroke].
+
+        table_bytes: bytes of the data table, will be read from the .csv file if not given
+
+        Raises OSError if the data table is to be read from a .csv file changed since it was opened, as the byte range of the table is no longer valid. Open the file again with open_table() then.
+        '''
+
+        if table_bytes == None:
+            if self.is_outdated() == True:
+                raise OSError("%s has been changed since it was opened, open it again to read sample %d" % (self._file_name, sample_number))
+            table_start, table_end = self._offsets[sample_number]
+            with open(self._file_name, 'rb') as f:
+                f.seek(table_start)
+                table_bytes = f.read(table_end - table_start)
+
+        try:
+            self._samples[sample_number] = parse_data_table(table_bytes.decode('Shift-JIS'))
+        except (ValueError, IndexError):
+            self.logger.warn("Data table of sample %d is not valid. Skipping." % sample_number)
+
+        # The byte range is no longer needed, whether the table was valid or not
+        self._offsets.pop(sample_number, None)
+
+        if sample_number in self._samples:
+            self._row_counts[sample_number] = len(self._samples[sample_number])
+        else:
+            self._row_counts.pop(sample_number, None)
+
+    @property
+    def sidecar_path(self):
+
+        '''
+        Path of the binary sidecar file keeping parsed data of the .csv file
+        '''
+
+        return self._file_name + '.tentackle.npz'
+
+    def _file_signature(self):
+
+        '''
+        Identify the current version of the .csv file
+
+        Return value: dict, {'path': resolved path, 'size': file size, 'mtime': modification time in ns}
+        '''
+
+        stat = os.stat(self._file_name)
+        return {
+            'path': os.path.realpath(self._file_name),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
+
+    def is_outdated(self):
+
+        '''
+        Tells if the .csv file has been changed on disk since it was loaded
+
+        The file is deemed unchanged if its size and modification time are unchanged, or, when the content hash of the loaded version is known, its contents are unchanged.
+        '''
+
+        try:
+            signature = self._file_signature()
+        except OSError:
+            return True
+
+        if signature == self.file_signature:
+            return False
+        if signature['size'] == self.file_signature['size'] and self.content_hash != None and self._file_hash() == self.content_hash:
+            # Touched or copied, but not changed
+            self.file_signature = signature
+            return False
+        return True
+
+    def _file_hash(self):
+
+        '''
+        Hash of the contents of the .csv file
+        '''
+
+        digest = hashlib.sha1()
+        with open(self._file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load_sidecar(self):
+
+        '''
+        Load parsed data from the sidecar file.
+
+        The sidecar is valid if the size of the .csv file is unchanged, and either its path and modification time or its content hash is unchanged.
+
+        Return value: bool, True if data has been loaded from a valid sidecar
+        '''
+
+        if not os.path.isfile(self.sidecar_path):
+            return False
+
+        try:
+            with np.load(self.sidecar_path, allow_pickle=False) as data:
+                info = json.loads(str(data['info']))
+                signature = self._file_signature()
+
+                if info.get('version') != SIDECAR_VERSION or info['size'] != signature['size']:
+                    return False
+                if (info['path'], info['mtime']) != (signature['path'], signature['mtime']) and info['hash'] != self._file_hash():
+                    return False
+
+                self.content_hash = info['hash']
+                self.headers = info['headers']
+                self.machine_type = MachineType(info['machine_type'])
+                self.base_shift_value = info['base_shift_value']
+                self._samples = {int(name.split('_')[1]): data[name] for name in data.files if name.startswith('sample_')}
+
+        except Exception as e:
+            # A broken sidecar is no worse than no sidecar
+            self.logger.debug("Unable to load sidecar %s: %s" % (self.sidecar_path, e))
+            self.headers = []
+            self._samples = {}
+            return False
+
+        self.logger.debug("Parsed data loaded from sidecar %s" % self.sidecar_path)
+        return True
+
+    def _save_sidecar(self):
+
+        '''
+        Write parsed data to the sidecar file. Failing to write the sidecar (e.g. read-only directory) is not an error.
+        '''
+
+        try:
+            self.content_hash = self._file_hash()
+            info = self._file_signature()
+            info.update({
+                'version': SIDECAR_VERSION,
+                'hash': self.content_hash,
+                'headers': self.headers,
+                'machine_type': self.machine_type.value,
+                'base_shift_value': self.base_shift_value
+            })
+            arrays = {'sample_%d' % sample_number: array for sample_number, array in self._samples.items()}
+
+            # Write to a temporary file first, so an interrupted write never leaves a broken sidecar behind
+            temp_path = self.sidecar_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                np.savez(f, info = np.array(json.dumps(info)), **arrays)
+            os.replace(temp_path, self.sidecar_path)
+
+        except OSError as e:
+            self.logger.debug("Unable to write sidecar %s: %s" % (self.sidecar_path, e))
+
+    def export_data(self, sample_numbers):
+
+        '''
+        Export parsed data of some samples, together with everything needed to rebuild the table from it without the .csv file
+
+        sample_numbers: iterable of sample numbers (batch * subbatch) to export
+
+        Return value: tuple, (info, arrays)
+        - info: dict, JSON serializable metadata, including signature and content hash of the .csv file the data comes from
+        - arrays: dict, structure: {sample_number: np.array([[force, stroke], ...]), ...}
+        '''
+
+        if self.content_hash == None and self.is_outdated() != True:
+            # The hash identifies the data wherever the .csv file is moved to
+            self.content_hash = self._file_hash()
+
+        info = dict(self.file_signature)
+        info.update({
+            'hash': self.content_hash,
+            'headers': self.headers,
+            'machine_type': self.machine_type.value,
+            'base_shift_value': self.base_shift_value,
+            'table_name': self._table_name
+        })
+
+        arrays = {}
+        for sample_number in sample_numbers:
+            if sample_number in self._offsets:
+                self._load_sample(sample_number)
+            if sample_number in self._samples:
+                arrays[sample_number] = self._samples[sample_number]
+
+        return info, arrays
+
+    def _load_embedded(self, info, arrays):
+
+        '''
+        Load data exported by Table.export_data()
+        '''
+
+        self.file_signature = {key: info[key] for key in ('path', 'size', 'mtime')}
+        self.content_hash = info['hash']
+        self.headers = info['headers']
+        self.machine_type = MachineType(info['machine_type'])
+        self.base_shift_value = info['base_shift_value']
+        self._table_name = info.get('table_name', self._table_name)
+        self._samples = dict(arrays)
+
+    def release_mapped_data(self):
+
+        '''
+        Copy sample data memory-mapped from a project file into memory, so the project file can be replaced
+        '''
+
+        for sample_number, array in self._samples.items():
+            if isinstance(array, np.memmap):
+                self._samples[sample_number] = np.array(array)
+
+    def _index_samples(self):
+
+        '''
+        Build the index of existing samples. A sample exists if it has both a data table and a row of dimensions.
+        '''
+
+        if self._row_counts == {}:
+            # Data loaded from sidecar
+            self._row_counts = {sample_number: len(array) for sample_number, array in self._samples.items()}
+
+        # Dimensions of a sample are in row 3 + sample_number, see self.dimensions()
+        last_sample_number = len(self.headers[2 + self.base_shift_value]) - 4
+        self._row_counts = {sample_number: row_count for sample_number, row_count in self._row_counts.items() if sample_number <= last_sample_number and row_count > 0}
+
+    def has_sample(self, batch, subbatch):
+
+        '''
+        Tells if data of a given batch and subbatch number combination exists, without parsing or converting any data
+        '''
+
+        return batch * subbatch in self._row_counts
+
+    def row_count(self, batch, subbatch):
+
+        '''
+        Amount of data rows of a given sample, 0 if the sample does not exist
+        '''
+
+        return self._row_counts.get(batch * subbatch, 0)
+
+    def _detect_machine_type(self, first_table):
+
+        '''
+        Detect intrument type from job file extension, which is found in the first table of the file
+        '''
+
+        if str.split(first_table[1][0], '.')[-1] == "tai":
+            self.logger.debug("Shimadzu EZ series")
+        elif str.split(first_table[1][0], '.')[-1] == "xtas":
+            self.logger.debug("Shimadzu AGS-X series")
+            self.base_shift_value = -1
+            self.machine_type = MachineType.AGSX
+        else:
+            self.logger.warn("Automatic machine type interpretation failed. Default to legacy... (Shimadzu EZ series)")
+
     @property
     def id(self):
         return str(self.table_id)
@@ -204,15 +1039,24 @@ class Table:
     def file_name(self):
         return self._file_name
 
+    @property
+    def curve_store_stats(self):
+
+        '''
+        Return hit/miss statistics of the processed curve store, which is shared by all tables
+        '''
+
+        return _curve_store.stats
+
     def dimensions(self, batch, subbatch):
 
         '''
         Find dimensions of a given sample specified by batch and subbatch
         '''
         sample_number = batch * subbatch
-        thickness = float(self.tables[2 + self.base_shift_value][3+sample_number][1])
-        width = float(self.tables[2 + self.base_shift_value][3+sample_number][2])
-        length = float(self.tables[2 + self.base_shift_value][3+sample_number][3])
+        thickness = float(self.headers[2 + self.base_shift_value][3+sample_number][1])
+        width = float(self.headers[2 + self.base_shift_value][3+sample_number][2])
+        length = float(self.headers[2 + self.base_shift_value][3+sample_number][3])
         # logger.debug("Dimensions for batch %d, subbatch %d: %s" % (batch, subbatch, (thickness, width, length)))
 
         return thickness, width, length
@@ -224,12 +1068,26 @@ class Table:
         '''
 
         sample_number = batch * subbatch
-        # Retrieve raw data, and make new numpy array
-        str_array = np.array(self.tables[3 + sample_number + self.base_shift_value][3:])
-        # Convert data type to float
-        array = str_array[:, [1, 2]].astype(np.single)
-        
-        return array
+        if sample_number in self._offsets:
+            # Parse data table on first access in lazy mode
+            self._load_sample(sample_number)
+        if sample_number not in self._samples:
+            raise IndexError("No data table for batch %d, subbatch %d" % (batch, subbatch))
+
+        # Return a copy, as the array will be modified in place by calculate()
+        return self._samples[sample_number].copy()
+
+    def regression_index(self, batch, subbatch):
+
+        '''
+        Get the Regression_index of a sample, built on first use and kept in the processed curve store
+        '''
+
+        index = _curve_store.get(('regression', self.table_id, batch, subbatch))
+        if index == None:
+            index = Regression_index(self.get_curve_data(batch, subbatch))
+            _curve_store.put(('regression', self.table_id, batch, subbatch), index)
+        return index
 
     def get_curve_data(self, batch, subbatch, truncate_point = -1, dry_run = False):
 
@@ -240,14 +1098,22 @@ class Table:
         This is for validating if data of a given batch and subbatch number combination exists.
         truncate_point: set the truncation point, if set, the return data will be truncated.
 
+        Processed curves are kept in a bounded store, so repeated calls for the same sample are lookups. Truncation is applied as a view of the stored curve. The returned array is read-only.
+
         '''
 
         try:
             if dry_run == True:
-                self.raw(batch, subbatch)
+                if self.has_sample(batch, subbatch) != True:
+                    raise IndexError("No data for batch %d, subbatch %d" % (batch, subbatch))
                 return True
             else:
-                calculated_curve = calculate(self.raw(batch, subbatch), self.dimensions(batch, subbatch))
+                calculated_curve = _curve_store.get((self.table_id, batch, subbatch))
+                if calculated_curve is None:
+                    calculated_curve = calculate(self.raw(batch, subbatch), self.dimensions(batch, subbatch))
+                    # Curves in store are shared by all callers, make sure none of them modifies it
+                    calculated_curve.flags.writeable = False
+                    _curve_store.put((self.table_id, batch, subbatch), calculated_curve)
                 if truncate_point == -1:
                     return calculated_curve
                 else:
@@ -256,8 +1122,354 @@ class Table:
             if self.logger != None:
                 self.logger.warn("Batch %d subbatch %d declared in data, but not found. Skipping." % (batch, subbatch))
 
-    def __str__(self):
-        return self._table_name
+    def __str__(self):
+        return self._table_name
+
+
+# Registry of opened tables, so every .csv file is parsed only once per process. Tables are dropped once nothing refers to them.
+_table_registry = weakref.WeakValueDictionary()   # Structure: {resolved_path: Table(), ...}
+_table_registry_lock = threading.Lock()
+
+def registered_table(file_path):
+
+    '''
+    Look up an opened table of a .csv file in the table registry
+
+    Return value: the Table object, or None if the file has not been opened, or has been changed since it was opened
+    '''
+
+    with _table_registry_lock:
+        table = _table_registry.get(os.path.realpath(file_path))
+
+    if table != None and table.is_outdated() != True:
+        return table
+    return None
+
+def register_table(table):
+
+    '''
+    Put a table in the table registry, replacing any table of the same file
+    '''
+
+    with _table_registry_lock:
+        _table_registry[table.file_signature['path']] = table
+
+def open_table(file_path, **kwargs):
+
+    '''
+    Open a .csv file as a Table object. If the file has been opened before and is unchanged on disk, the existing Table object is returned.
+
+    kwargs: passed to Table() when the file needs to be loaded
+    '''
+
+    table = registered_table(file_path)
+    if table == None:
+        table = Table(file_path, **kwargs)
+        register_table(table)
+    return table
+
+def write_project(file_path, contents, arrays, compress = False):
+
+    '''
+    Write a binary project file, a .npz container holding a JSON document and named arrays. The file is written to a temporary file first, and then moved into place.
+
+    contents: dict, JSON serializable project contents
+    arrays: dict, structure: {name: np.array(), ...}
+    compress: bool, whether to compress arrays. Uncompressed arrays can be memory-mapped by read_project().
+    '''
+
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        if compress == True:
+            np.savez_compressed(f, project = np.array(json.dumps(contents)), **arrays)
+        else:
+            np.savez(f, project = np.array(json.dumps(contents)), **arrays)
+    os.replace(temp_path, file_path)
+
+def read_project(file_path, mmap = True):
+
+    '''
+    Read a binary project file written by write_project()
+
+    mmap: bool, if True, arrays stored uncompressed are memory-mapped instead of read
+
+    Return value: tuple, (contents, arrays)
+    '''
+
+    arrays = {}
+    with np.load(file_path, allow_pickle = False) as data:
+        contents = json.loads(str(data['project']))
+        names = [name for name in data.files if name != 'project']
+
+        if mmap != True:
+            arrays = {name: data[name] for name in names}
+            return contents, arrays
+
+    with zipfile.ZipFile(file_path) as archive, open(file_path, 'rb') as f:
+        for name in names:
+            member = archive.getinfo(name + '.npy')
+            if member.compress_type != zipfile.ZIP_STORED:
+                with archive.open(member) as member_file:
+                    arrays[name] = np.lib.format.read_array(member_file, allow_pickle = False)
+                continue
+
+            # Locate the .npy data in the file: local file header (30 bytes, then file name and extra field), then .npy header
+            f.seek(member.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(member.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if np.prod(shape) == 0:
+                # Empty arrays can not be memory-mapped
+                arrays[name] = np.empty(shape, dtype = dtype)
+                continue
+            arrays[name] = np.memmap(file_path, dtype = dtype, mode = 'r', offset = f.tell(), shape = shape, order = 'F' if fortran_order else 'C')
+
+    return contents, arrays
+
+def write_snapshot_file(file_path, contents, arrays = None):
+
+    '''
+    Write a snapshot file, as a binary project file if file_path ends with PROJECT_EXTENSION, otherwise as JSON. The file is written to a temporary file first, and then moved into place, so an interrupted write never leaves a broken snapshot behind.
+
+    contents: dict, JSON serializable snapshot contents
+    arrays: dict, arrays embedded in binary project files, see write_project()
+    '''
+
+    if file_path.endswith(PROJECT_EXTENSION):
+        write_project(file_path, contents, arrays or {}, compress = config.config.get('project', {}).get('compress', False))
+    else:
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump(contents, fp)
+        os.replace(temp_path, file_path)
+
+def read_journal(file_path):
+
+    '''
+    Read entries of a journal file. An incomplete last line, left by a crash while writing, is ignored.
+
+    Return value: list of entries, empty if the journal does not exist
+    '''
+
+    entries = []
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.debug("Skipping broken line in journal %s" % file_path)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class Journal():
+
+    '''
+    Append-only journal of changes of a Curve_cache, kept next to its snapshot file as <snapshot file>.journal in JSON Lines format. Every change is written as soon as it is made, so no change is lost if the program dies before a save.
+
+    Entries are written by a background thread, so recording a change never waits for the disk. Entry types:
+    - {"tables": {filename: [[batch, subbatch, truncation], ...] or null, ...}}: new selections of changed table files, null for removed table files
+    - {"save": true}: the cache has been saved at this point
+    '''
+
+    def __init__(self, snapshot_path):
+
+        '''
+        snapshot_path: string, path of the snapshot file the journal belongs to
+        '''
+
+        self.path = snapshot_path + JOURNAL_SUFFIX
+        self.error = None   # First exception raised in the background thread since the last call of take_error()
+        self.entries = 0    # Amount of entries since the last compaction
+        try:
+            self.entries = len(read_journal(self.path))
+        except OSError as e:
+            self._fail(e)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target = self._run, name = 'journal', daemon = True)
+        self._thread.start()
+
+    def append(self, entry):
+
+        '''
+        Queue an entry to be written
+        '''
+
+        self.entries += 1
+        self._queue.put(('append', entry))
+
+    def compact(self, write_snapshot):
+
+        '''
+        Queue a compaction: write_snapshot() is called to write the full snapshot, then the journal is emptied. If writing the snapshot fails, the journal is kept.
+
+        write_snapshot: callable, writes the snapshot file atomically. It is called in the background thread, after all entries queued before it have been written.
+        '''
+
+        self.entries = 0
+        self._queue.put(('compact', write_snapshot))
+
+    def take_error(self):
+
+        '''
+        Return the first exception raised in the background thread since the last call, and forget it. None if nothing has failed.
+
+        Once the journal file could not be opened, or an entry or a compaction has failed, the snapshot file and the journal may not hold every change, so the snapshot file should be written in full again.
+        '''
+
+        error, self.error = self.error, None
+        return error
+
+    def flush(self):
+
+        '''
+        Wait until all queued entries have been written, or have failed
+        '''
+
+        self._queue.join()
+
+    def close(self):
+
+        '''
+        Write all queued entries, and stop the background thread
+        '''
+
+        self._queue.put(None)
+        self._thread.join()
+
+    def _fail(self, e):
+        logger.error("Unable to write journal %s: %s" % (self.path, e))
+        if self.error == None:
+            self.error = e
+
+    def _run(self):
+
+        f = None
+        try:
+            f = open(self.path, 'a')
+            if f.tell() > 0:
+                # Terminate an incomplete last line left by a crash, so it does not swallow the next entry
+                with open(self.path, 'rb') as existing:
+                    existing.seek(-1, os.SEEK_END)
+                    if existing.read(1) != b'\n':
+                        f.write('\n')
+        except Exception as e:
+            # Tasks are still taken from the queue below, so flush() and close() do not wait forever
+            self._fail(e)
+
+        try:
+            while True:
+                task = self._queue.get()
+                try:
+                    if task == None:
+                        return
+                    if f == None:
+                        continue
+
+                    action, payload = task
+                    if action == 'append':
+                        f.write(json.dumps(payload) + '\n')
+                    else:
+                        f.flush()
+                        payload()
+                        f.seek(0)
+                        f.truncate()
+
+                    # Write several queued entries at once
+                    if self._queue.empty():
+                        f.flush()
+                        os.fsync(f.fileno())
+                except Exception as e:
+                    self._fail(e)
+                finally:
+                    self._queue.task_done()
+        finally:
+            if f != None:
+                f.close()
+
+
+def pool_context():
+
+    '''
+    Multiprocessing context for process pools. Forking a process with other threads running, like a GUI, may deadlock the forked worker, so pools started outside of the main thread start their workers from a fresh process ('forkserver', or 'spawn' where it is not available).
+
+    Return value: a multiprocessing context, or None for the default one
+    '''
+
+    if threading.current_thread() is threading.main_thread():
+        return None
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def _load_table(file_path, kwargs):
+
+    '''
+    Worker of load_tables(), construct a Table in a worker process
+    '''
+
+    return Table(file_path, **kwargs)
+
+def load_tables(file_paths, workers = None, progress = None, **kwargs):
+
+    '''
+    Load multiple .csv files to Table objects in parallel, using a process pool. Files in the table registry are not loaded again.
+
+    file_paths: list of paths of .csv files
+    workers: int, amount of worker processes. If None, follows config['parallel']['workers'], and defaults to the amount of CPU cores. Files are loaded in the current process if workers == 1 or only one file is given.
+    progress: callable, progress(done, total) is called each time a file has been loaded. If it returns False, loading stops, and files not loaded yet are left as None.
+    kwargs: passed to Table()
+
+    Return value: tuple, (tables, errors)
+    - tables: list of Table objects, in the same order as file_paths. None for files failed to load.
+    - errors: dict of exceptions raised when loading files, structure: {file_path: exception, ...}
+    '''
+
+    if workers == None:
+        workers = config.config.get('parallel', {}).get('workers') or os.cpu_count() or 1
+
+    # Reuse tables that have been opened before
+    tables = [registered_table(file_path) for file_path in file_paths]
+    errors = {}
+    pending = [i for i, table in enumerate(tables) if table == None]
+    done = len(file_paths) - len(pending)
+
+    if workers == 1 or len(pending) <= 1:
+        for i in pending:
+            try:
+                tables[i] = Table(file_paths[i], **kwargs)
+            except Exception as e:
+                errors[file_paths[i]] = e
+            done += 1
+            if progress != None and progress(done, len(file_paths)) == False:
+                break
+    else:
+        with ProcessPoolExecutor(max_workers = min(workers, len(pending)), mp_context = pool_context()) as executor:
+            futures = [executor.submit(_load_table, file_paths[i], kwargs) for i in pending]
+            for i, future in zip(pending, futures):
+                try:
+                    tables[i] = future.result()
+                except Exception as e:
+                    errors[file_paths[i]] = e
+                done += 1
+                if progress != None and progress(done, len(file_paths)) == False:
+                    # Files not started yet are dropped, the ones being loaded are waited for
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    break
+
+    for i in pending:
+        if tables[i] != None:
+            register_table(tables[i])
+
+    for file_path, e in errors.items():
+        logger.error("Unable to load %s: %s" % (file_path, e))
+
+    return tables, errors
 
 
 class Curve_cache():
@@ -270,13 +1482,22 @@ class Curve_cache():
         super().__init__()
 
         self._cache_status = {}     # Current status of the cache, a LUT for looking up index and truncation of selected curves of each table file being cached, structure: {table_id1: {batch1: {subbatch1: truncation1, ...}, ...}, ...}
+                                    # Never modified in place: every edit builds new dicts along the changed path, and shares the rest with snapshots
         self._ref_lut = {} # LUT for refereces to Table() objects, format: {table_id: Table(), ...}
         self._snapshot = [] # Snapshot stack for self.cache_status(), structure: [cache_status_1, cache_status_2, ...]
+        self._snapshot_sizes = []   # Estimated memory of the dicts each snapshot does not share with the previous one, in bytes
+        self._dropped_snapshots = 0 # Amount of old snapshots dropped to bound the history
         self._pointer = -1  # A pointer indicating the current position in status snapshot
         self._snapshot_saved_pos = None # A position in self._snapshot, at which the snapshot has been saved to a JSON snapshot file
         self._working_snapshot_file = None # The path of active JSON snapshot file
+        self._journal = None    # Journal of changes since the active snapshot file was last written, see Journal
+        self._written_settings = None   # Config and notes as last written to the active snapshot file, the journal only records selections
+        self._transaction_depth = 0 # Depth of nested self.transaction() blocks, snapshots are deferred while above 0
+        self._revision = 0  # Incremented once per committed change of cache status, see self.revision
         self.name = name
         self.description = '' # Plain text description of the file
+        self.snapshot_config = None # Config read from the last restored snapshot file, see self.restore_snapshot()
+        self._metrics_store = LRU_store(config.config.get('cache', {}).get('analysis_store_mb', 16) * 2**20)  # Analysis values of single curves, see self._metrics_key()
         
         self.update_snapshot()  # Set initial status
 
@@ -305,11 +1526,29 @@ class Curve_cache():
             Tells if the current cache status is different from last save/load process
         '''
 
-        if self._snapshot_saved_pos == self._pointer:
+        if self._snapshot_saved_pos == self._pointer and (self._journal == None or self._journal.error == None):
             return False
         else:
             return True
 
+    @property
+    def revision(self):
+
+        '''
+            A counter incremented once each time the cache status changes through history (an edit, a transaction, undo or redo). Caches built on top of the cache status can compare it to tell whether they are outdated.
+        '''
+
+        return self._revision
+
+    @property
+    def analysis_stats(self):
+
+        '''
+            Return hit/miss statistics of stored analysis values of single curves
+        '''
+
+        return self._metrics_store.stats
+
     @property
     def working_snapshot_file(self):
 
@@ -327,7 +1566,7 @@ class Curve_cache():
             selections: list of selction
             * selection: a tuple containing batch (required), subbatch (required), truncation point (optional)
 
-            Notice: If a table has been cached before, then when it is cached again, the previous caching action gets reverted. All table objects pointing to a same data file will be deemed as the same object.
+            Notice: If a table has been cached before, then when it is cached again, the previous caching action gets reverted. All table objects pointing to a same data file will be deemed as the same object. Open tables with open_table(), so a data file is represented by one table object.
         '''
 
         cached_info = {}     # List of indices of cached curves of the current operating table file
@@ -356,8 +1595,10 @@ class Curve_cache():
                         cached_info[batch][subbatch] = -1
                         # self._curve_index += 1    # Set index counter
 
-        # Write import record
-        self._cache_status[table.id] = cached_info
+        # Write import record, replacing records of other table objects of the same data file
+        path = table.file_signature['path']
+        self._cache_status = {table_id: table_contents for table_id, table_contents in self._cache_status.items() if table_id == table.id or self._ref_lut[table_id].file_signature['path'] != path}
+        self._cache_status = {**self._cache_status, table.id: cached_info}
         self._ref_lut[table.id] = table
 
         # Update status snapshot
@@ -403,8 +1644,10 @@ class Curve_cache():
         # # Lookup the table file for the curve
         # curve = self._cache[index]
 
-        # Rewrite truncation point information
-        self._cache_status[table_id][batch][subbatch] = truncate_at
+        # Rewrite truncation point information, copying only the dicts on the path to it
+        table_status = self._cache_status[table_id]
+        batch_status = {**table_status[batch], subbatch: truncate_at}
+        self._cache_status = {**self._cache_status, table_id: {**table_status, batch: batch_status}}
         # curve.truncate_point = truncate_at  # Legacy compatibility solution
 
         # Update snapshot
@@ -416,40 +1659,183 @@ class Curve_cache():
 
         '''
             Remove one curve/batch/table in cache
+
+            The table stays in self.lut, so the removal can be undone.
         '''
 
-        self._cache_status[table_id][batch].pop(subbatch, None)
+        # Build new dicts along the path to the removed item, instead of changing dicts shared with snapshots
+        status = dict(self._cache_status)
+        table_status = dict(status.get(table_id, {}))
+        batch_status = dict(table_status.get(batch, {}))
 
-        if self._cache_status[table_id][batch] == {} or subbatch == None:
+        batch_status.pop(subbatch, None)
+
+        if batch_status == {} or subbatch == None:
             # If batch is empty or no subbatch is given (deem as delete the whole batch), remove the subbatch
-            self._cache_status[table_id].pop(batch, None)
+            table_status.pop(batch, None)
+        else:
+            table_status[batch] = batch_status
 
-        if self._cache_status[table_id] == {} or batch == None and subbatch == None:
+        if table_status == {} or batch == None and subbatch == None:
             # If table is empty or no batch and subbatch is given (deem as delete the whole table), remove the table
-            self._cache_status.pop(table_id, None)
-            self._ref_lut.pop(table_id, None)
+            status.pop(table_id, None)
+        else:
+            status[table_id] = table_status
+
+        self._cache_status = status
 
         # Update snapshot
         self.update_snapshot()
 
 
+    @contextmanager
+    def transaction(self):
+
+        '''
+            Group cache(), remove(), set_truncation() and clear() calls into one history entry
+
+            Usage:
+                with cache.transaction():
+                    cache.cache(table_1)
+                    cache.remove(table_2.id)
+
+            Transactions can be nested, only the outermost one takes the snapshot. No snapshot is taken if nothing has changed. If an exception is raised inside the block, the cache status is rolled back to the state before the transaction.
+        '''
+
+        pointer = self._pointer
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._pointer = pointer
+                self._cache_status = self._snapshot[self._pointer]
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0 and self._cache_status is not self._snapshot[self._pointer]:
+                self.update_snapshot()
+
     def update_snapshot(self):
 
         '''
             Update snapshot and manage pointer
+
+            Inside self.transaction(), the snapshot is deferred to the end of the outermost transaction.
+
+            Snapshots share every dict that has not been changed since the previous snapshot, so each snapshot only costs the dicts along the changed paths. The history is bounded by config['history']['max_depth'] snapshots and config['history']['max_memory_mb'] of unshared dicts; the oldest snapshots are dropped first.
         '''
 
+        if self._transaction_depth > 0:
+            return
+
         # Verify if there is anything beyond the current pointer position
         if len(self._snapshot) > self._pointer + 1:
             # If yes, then drop everything beyond
-            self._snapshot = self._snapshot[: self._pointer + 1]
+            del self._snapshot[self._pointer + 1:]
+            del self._snapshot_sizes[self._pointer + 1:]
+
+        # Estimate memory of dicts not shared with the previous snapshot
+        previous = self._snapshot[-1] if self._snapshot != [] else {}
+        size = sys.getsizeof(self._cache_status)
+        for table_id, table_status in self._cache_status.items():
+            previous_table_status = previous.get(table_id)
+            if table_status is not previous_table_status:
+                size += sys.getsizeof(table_status)
+                for batch, batch_status in table_status.items():
+                    if previous_table_status == None or batch_status is not previous_table_status.get(batch):
+                        size += sys.getsizeof(batch_status)
 
         # Move pointer
         self._pointer += 1
 
         # Update snapshot
 
-        self._snapshot.append(self._cache_status.copy())
+        self._snapshot.append(self._cache_status)
+        self._snapshot_sizes.append(size)
+        self._revision += 1
+        self._record_change(previous)
+
+        self._prune_snapshots()
+
+    def _record_change(self, previous):
+
+        '''
+            Write the change from previous cache status to the current one to the journal, if there is an active one. Only table files whose selections have changed are written.
+        '''
+
+        if self._journal == None:
+            return
+
+        tables = {}
+        for table_id, table_status in self._cache_status.items():
+            # Unchanged tables share the same dict with the previous status
+            if previous.get(table_id) is not table_status:
+                tables[self._ref_lut[table_id].file_name] = [[batch, subbatch, truncate_point] for batch, batch_status in table_status.items() for subbatch, truncate_point in batch_status.items()]
+        for table_id in previous.keys():
+            if table_id not in self._cache_status:
+                tables[self._ref_lut[table_id].file_name] = None
+
+        if tables != {}:
+            self._journal.append({'tables': tables})
+
+    def _open_journal(self, snapshot_path):
+
+        '''
+            Start journaling changes next to a snapshot file, if enabled in config['journal']
+        '''
+
+        self.close()
+        if config.config.get('journal', {}).get('enabled', True) == True:
+            self._journal = Journal(snapshot_path)
+
+    def close(self):
+
+        '''
+            Write all pending journal entries and stop journaling. Call before exiting, so no recorded change is lost.
+
+            Return value: bool, False if writing the journal or a snapshot file in the background has failed, so changes may have been lost
+        '''
+
+        if self._journal != None:
+            self._journal.close()
+            error = self._journal.take_error()
+            self._journal = None
+            if error != None:
+                logger.error("Changes of %s may not have been saved: %s" % (self._working_snapshot_file, error))
+                self._written_settings = None
+                return False
+        return True
+
+    def _prune_snapshots(self):
+
+        '''
+            Drop the oldest snapshots, until the history fits in config['history']. At least 2 snapshots are kept, so the last action can always be undone.
+        '''
+
+        settings = config.config.get('history', {})
+        max_depth = max(settings.get('max_depth', 1000), 2)
+        max_memory = settings.get('max_memory_mb', 64) * 2**20
+
+        drop = max(len(self._snapshot) - max_depth, 0)
+        memory = sum(self._snapshot_sizes[drop:])
+        while len(self._snapshot) - drop > 2 and memory > max_memory:
+            memory -= self._snapshot_sizes[drop]
+            drop += 1
+
+        # Never drop the current snapshot
+        drop = min(drop, self._pointer)
+        if drop > 0:
+            del self._snapshot[:drop]
+            del self._snapshot_sizes[:drop]
+            self._pointer -= drop
+            self._dropped_snapshots += drop
+            if self._snapshot_saved_pos != None:
+                self._snapshot_saved_pos -= drop
+                if self._snapshot_saved_pos < 0:
+                    # The saved version is no longer in history
+                    self._snapshot_saved_pos = None
 
 
     def undo(self, dry_run = False):
@@ -474,10 +1860,13 @@ class Curve_cache():
             if dry_run != True:
 
                 # If something can be undone, move pointer
+                previous = self._cache_status
                 self._pointer -= 1
 
-                # Rewrite cache status
-                self._cache_status = self._snapshot[self._pointer].copy()
+                # Rewrite cache status, snapshots are never modified so no copy is needed
+                self._cache_status = self._snapshot[self._pointer]
+                self._revision += 1
+                self._record_change(previous)
 
             # If the status can be further reverted
             if self._pointer > 0:
@@ -512,10 +1901,13 @@ class Curve_cache():
             if dry_run != True:
 
                 # If something can be redone, move pointer
+                previous = self._cache_status
                 self._pointer += 1
 
-                # Rewrite cache status
-                self._cache_status = self._snapshot[self._pointer].copy()
+                # Rewrite cache status, snapshots are never modified so no copy is needed
+                self._cache_status = self._snapshot[self._pointer]
+                self._revision += 1
+                self._record_change(previous)
 
             # If the status can be further moved
             if len(self._snapshot) - self._pointer > 1:
@@ -533,12 +1925,18 @@ class Curve_cache():
         '''
         # self._curve_index = 0
         # self._cache = {}
+        self.close()
         self._cache_status = {}
         self._ref_lut = {}
         self._snapshot = []
+        self._snapshot_sizes = []
+        self._dropped_snapshots = 0
         self._pointer = -1
         self._snapshot_saved_pos = None
         self._working_snapshot_file = None
+        self._written_settings = None
+        self.snapshot_config = None
+        self._transaction_depth = 0
 
         self.update_snapshot()
     
@@ -549,7 +1947,7 @@ class Curve_cache():
         '''
         # All actions generates history snapshots
         # If history snapshot is empty, then this cache can be deemed empty
-        if len(self._snapshot) == 1:
+        if len(self._snapshot) == 1 and self._dropped_snapshots == 0:
             return True
         else:
             return False
@@ -565,6 +1963,20 @@ class Curve_cache():
 
         self.update_snapshot()
 
+    def _metrics_key(self, table, batch, subbatch, truncate_point):
+
+        '''
+            Key of stored analysis values of a curve. Includes everything the values depend on: version of the data file, the curve, truncation, regression range and scaling.
+        '''
+
+        return (
+            table.file_signature['path'], table.file_signature['size'], table.file_signature['mtime'],
+            batch, subbatch, truncate_point,
+            config.config['regression']['start'], config.config['regression']['end'],
+            config.config['regression'].get('auto', False), config.config['regression'].get('auto_min_width'), config.config['regression'].get('auto_max_strain'), config.config['regression'].get('auto_steps'),
+            config.config['axis']['x_scaling'], config.config['axis']['y_scaling']
+        )
+
     def analyze(self, selection = None):
 
         '''
@@ -572,12 +1984,13 @@ class Curve_cache():
 
         selection: a dict of curves in the same format as in self._cache_status, if None, then every curve in the cache will be analyzed.
 
+        Analysis values of single curves are stored, so after an edit only new or changed curves are calculated. See self.analysis_stats.
         '''
 
-        strength_pool = []
-        slope_pool = []
-        toughness_pool = []
-        sab_pool = []      
+        keys = []   # Keys of analysis values of every curve
+        values_list = []    # Analysis values of every curve, in the order of METRIC_NAMES
+        missing = []    # Curves without stored analysis values, structure: [(position in keys, curve, regression index), ...]
+        auto = config.config['regression'].get('auto', False) == True   # Regression indices are only needed to search for the most linear window
         
         # Make sure that there's something in the cache
         if self._cache_status == {}:
@@ -587,7 +2000,7 @@ class Curve_cache():
         if selection != None:
             selection = self._cache_status
 
-        # Traverse the whole selection, calculate values for every curve
+        # Traverse the whole selection, look up stored values for every curve, and collect curves without stored values
         for table_id, table_contents in self._cache_status.items():
 
             table = self._ref_lut[table_id] # Get reference to the Table object
@@ -595,66 +2008,76 @@ class Curve_cache():
             for batch, batch_contents in table_contents.items():
                 for subbatch, truncate_point in batch_contents.items():
 
-                    data = table.get_curve_data(batch, subbatch, truncate_point)
-
-                    max_stress_point = max_stress(data)
-                    strain_value_at_break = strain_at_break(data)
-                    slope = linear_regression(data)
-                    toughness = (integrate_x(data))/config.config["axis"]["y_scaling"] # Convert to N/m^2
-
-                    strength_pool.append(max_stress_point)
-                    slope_pool.append(slope)
-                    toughness_pool.append(toughness)
-                    sab_pool.append(strain_value_at_break)
-
-        strength_array = np.array(strength_pool)
-        slope_array = np.array(slope_pool)
-        toughness_array = np.array(toughness_pool)
-        sab_array = np.array(sab_pool)
+                    key = self._metrics_key(table, batch, subbatch, truncate_point)
+                    values = self._metrics_store.get(key)
+                    if values is None:
+                        missing.append((len(keys), table.get_curve_data(batch, subbatch, truncate_point), table.regression_index(batch, subbatch) if auto else None))
+                    keys.append(key)
+                    values_list.append(values)
+
+        # Calculate values for all new curves at once
+        if missing != []:
+            metrics = analyze_curves([curve for position, curve, index in missing], [index for position, curve, index in missing] if auto else None)
+            for i, (position, curve, index) in enumerate(missing):
+                values = np.array([metrics[name][i] for name in METRIC_NAMES])
+                self._metrics_store.put(keys[position], values)
+                values_list[position] = values
+
+        metrics = dict(zip(METRIC_NAMES, np.array(values_list).T))
+        strength_array = np.stack((metrics['uts'], metrics['sams']), axis = 1)
+        slope_array = metrics['ym']
+        toughness_array = metrics['toughness']
+        sab_array = metrics['sab']
 
         # print(slope_array)
         # print(toughness_array)
 
+        # Curves without a value, like Young's modulus of a curve with less than 2 points in the regression window, are left out of averages
+        for name in METRIC_NAMES:
+            nan_count = int(np.count_nonzero(np.isnan(metrics[name])))
+            if nan_count > 0:
+                logger.warning("%s could not be calculated for %d of %d curves, they are left out of the average." % (name, nan_count, len(values_list)))
+
         analysis_result = { # Dictionary object of analysis result
 
             'ym':{  
 
                 # Young's Modulus
 
-                'value': np.average(slope_array[:, 0])/config.config["axis"]["y_scaling"],
-                'std': np.std(slope_array[:, 0])/config.config["axis"]["y_scaling"],
+                'value': _nan_average(slope_array)/config.config["axis"]["y_scaling"],
+                'std': _nan_std(slope_array)/config.config["axis"]["y_scaling"],
                 'unit': config.config['axis']['y_unit']
             },
             'uts':{
 
                 # Ultimate tensile strength
 
-                'value': np.average(strength_array[:, 0])/config.config["axis"]["y_scaling"],
-                'std': np.std(strength_array[:, 0])/config.config["axis"]["y_scaling"],
+                'value': _nan_average(strength_array[:, 0])/config.config["axis"]["y_scaling"],
+                'std': _nan_std(strength_array[:, 0])/config.config["axis"]["y_scaling"],
                 'unit': config.config['axis']['y_unit']
             },
             'sams':{
 
                 # Strain at maximum stress
 
-                'value': np.average(strength_array[:, 1])/config.config["axis"]["y_scaling"],
-                'std': np.std(strength_array[:, 1])/config.config["axis"]["y_scaling"],
+                'value': _nan_average(strength_array[:, 1])/config.config["axis"]["x_scaling"],
+                'std': _nan_std(strength_array[:, 1])/config.config["axis"]["x_scaling"],
                 'unit': config.config["axis"]["x_unit"]
 
             },
             'sab':{
 
                 # Strain at break
-                'value': np.average(sab_array)/config.config["axis"]["x_scaling"],
-                'std': np.std(sab_array)/config.config["axis"]["x_scaling"],
+                'value': _nan_average(sab_array)/config.config["axis"]["x_scaling"],
+                'std': _nan_std(sab_array)/config.config["axis"]["x_scaling"],
                 'unit': config.config["axis"]["x_unit"]
             },
             'toughness':{
 
                 # Area covered by the curve
 
-                'value': np.average(toughness_array),
-                'std': np.std(toughness_array),
+                'value': _nan_average(toughness_array),
+                'std': _nan_std(toughness_array),
                 'unit': 'N*m^-2'
             }
         }
@@ -665,12 +2088,17 @@ class Curve_cache():
 
         return analysis_result        
 
-    def take_snapshot(self, file_path = None):
+    def take_snapshot(self, file_path = None, embed = None):
 
         '''
-            Save current cache to a .json file, for editing in the future
+            Save current cache to a project file, for editing in the future
+
+            - `file_path`: optional, specifies the save path. Paths ending with .json are saved as JSON snapshot files (version 2), which only refer to the .csv files. Other paths are saved as binary project files (version 3, see PROJECT_EXTENSION), which is appended if missing. If no path selected, will first attempt to save to the current active snapshot file. If active snapshot file path has not been set, save to the same directory as the corresponding .csv file of the 1st curve.
+            - `embed`: bool, whether to embed data of the cached curves into binary project files, so they can be opened without the .csv files and without parsing. If None, follows config['project']['embed'].
 
-            - `file_path`: optional, specifies the save path of the .json file. If no path selected, will first attempt to save to the current active JSON snapshot file. If active JSON file path has not been set, save to the same directory as the corresponding .csv file of the 1st curve.
+            Once a snapshot file has been written, every change is appended to its journal in the background (see Journal). Saving to the active snapshot file again only marks the save in the journal. When the journal has more than config['journal']['compact_after'] entries, or config or notes have changed since the snapshot file was written (they are not journaled), the snapshot file is rewritten in the background, and the journal is emptied.
+
+            Return value: path of the saved file, or -1 if saving failed
         '''
 
         # Figure out where to save the save file
@@ -679,61 +2107,120 @@ class Curve_cache():
 
         if file_path != None:
             # If a path is given, check if the path is legal and correct it
-            if file_path.endswith('.json'):
+            if file_path.endswith('.json') or file_path.endswith(PROJECT_EXTENSION):
                 path = file_path
             else:
-                path = file_path + '.json'
+                path = file_path + PROJECT_EXTENSION
 
         elif self._working_snapshot_file != None:
             # If no path is given but active JSON file path has been set, use the latter
             path = self._working_snapshot_file
-        else:
+        elif self._cache_status != {}:
             # If no path is given and no active JSON file path has been set, save to the same directory as the corresponding .csv file of the 1st curve.
-            first_pos = list(self._cache.keys())[0]   # Get index of the 1st element in cache
-            path = os.path.splitext(self._cache[first_pos].table.file_name)[0] + '.json'
+            first_table_id = list(self._cache_status.keys())[0]   # Get id of the 1st table in cache
+            path = os.path.splitext(self._ref_lut[first_table_id].file_name)[0] + PROJECT_EXTENSION
             logger.debug('No file path specified. Saving file to default location: %s' % path)
+        else:
+            logger.debug('No file path specified and nothing cached. Nothing to save.')
+            return -1
 
+        if embed == None:
+            embed = config.config.get('project', {}).get('embed', True)
+
+        # Copied, so later changes of config do not leak into the comparison, or into contents written in the background
+        settings = json.loads(json.dumps({'config': config.config, 'notes': self.description}))
+
+        # A failed compaction or journal means the snapshot file may be missing changes, so it is written in full again
+        journal_failed = False
+        if self._journal != None:
+            error = self._journal.take_error()
+            if error != None:
+                logger.error("Saving %s in the background has failed: %s. Writing it again." % (self._working_snapshot_file, error))
+                self._written_settings = None
+                journal_failed = True
+
+        compact = False
+        if self._journal != None and path == self._working_snapshot_file and journal_failed == False:
+            if self._journal.entries < config.config.get('journal', {}).get('compact_after', 500) and settings == self._written_settings:
+                # Every change has been journaled already
+                self._journal.append({'save': True})
+                self._snapshot_saved_pos = self._pointer
+                return path
+            compact = True
 
         # Construst LUT for curves that has been cached
         # LUT is like another version of self._cache_status; Hovever, the value of each item is a tuple containing curve info.
         lut = {}    # Structure of LUT: {filename:[(batch, subbatch, truncation), ...]}
+        tables = {} # Data of each table file for binary project files, structure: {filename: info, ...}
+        arrays = {} # Embedded arrays, named as 'table_<index>_sample_<sample_number>'
 
-        for table_id, table_contents in self._cache_status.items():
-            
-            curve_info_list = []
-            file_name = self._ref_lut[table_id].file_name
+        try:
+            for table_index, (table_id, table_contents) in enumerate(self._cache_status.items()):
+                
+                curve_info_list = []
+                table = self._ref_lut[table_id]
+                file_name = table.file_name
 
-            # Translation from dictionary to info tuple
-            for batch, batch_contents in table_contents.items():
-                for subbatch, truncate_point in batch_contents.items():
-                    curve_info_list.append([batch, subbatch, truncate_point])
+                # Translation from dictionary to info tuple
+                for batch, batch_contents in table_contents.items():
+                    for subbatch, truncate_point in batch_contents.items():
+                        curve_info_list.append([batch, subbatch, truncate_point])
+
+                lut[file_name] = curve_info_list
 
-            lut[file_name] = curve_info_list
+                if path.endswith(PROJECT_EXTENSION):
+                    # The file may be replaced below, it must not be mapped to memory anymore
+                    table.release_mapped_data()
+
+                    info, table_arrays = table.export_data(batch * subbatch for batch, subbatch, truncate_point in curve_info_list)
+                    if embed == True:
+                        info['arrays'] = 'table_%d' % table_index
+                        for sample_number, array in table_arrays.items():
+                            arrays['table_%d_sample_%d' % (table_index, sample_number)] = array
+                    tables[file_name] = info
+
+        except Exception as e:
+            logger.debug(e)
+            return -1
 
 
         # Construct file contents
 
         snapshot_contents = {
             "assets": lut,
-            "config.config": config.config,
+            "config": settings['config'],
             "metadata": {
-                "notes": ""
+                "notes": settings['notes']
             },
             "version": 2
         }
         
+        if path.endswith(PROJECT_EXTENSION):
+            snapshot_contents['tables'] = tables
+            snapshot_contents['version'] = PROJECT_VERSION
+        
         # Save to file
 
         try:
-            with open(path, 'w') as fp:
-                json.dump(snapshot_contents, fp)
-                
-                # Mark the current status as "saved"
-                self._snapshot_saved_pos = self._pointer
-                # Set new working JSON path
-                self._working_snapshot_file = path
+            if compact == True:
+                # Contents are written later in the background
+                self._journal.compact(lambda: write_snapshot_file(path, snapshot_contents, arrays))
+            else:
+                write_snapshot_file(path, snapshot_contents, arrays)
+
+                # Entries in an existing journal of this path do not belong to the new snapshot
+                self.close()
+                if os.path.isfile(path + JOURNAL_SUFFIX):
+                    os.remove(path + JOURNAL_SUFFIX)
+                self._open_journal(path)
 
-            return file_path
+            # Mark the current status as "saved"
+            self._snapshot_saved_pos = self._pointer
+            self._written_settings = settings
+            # Set new working JSON path
+            self._working_snapshot_file = path
+
+            return path
         except Exception as e:
             logger.debug(e)
             return -1
@@ -741,16 +2228,23 @@ class Curve_cache():
             
 
 
-    def restore_snapshot(self, file_path, force = False):
+    def restore_snapshot(self, file_path, force = False, progress = None, apply_config = True):
 
         '''
-            Retore cache from a .json snapshot file
+            Retore cache from a .json snapshot file or a binary project file
 
-            file_path: string, specifies the .json file to retore
+            file_path: string, specifies the file to retore
             force: bool, if True, then anything in current cache will be overwritten; if False, then this function will refuse to restore if something is already in the cache.
+            progress: callable, passed to load_tables() for loading .csv files. If it stops loading, files not loaded are skipped.
+            apply_config: bool, whether to replace config.config with the config saved in the file. If False, the saved config is only kept in self.snapshot_config, so it can be applied once restoration has succeeded.
+
+            Curves embedded in binary project files are rebuilt from the project file, without reading the .csv files. Other curves are loaded from their .csv files.
+
+            Changes recorded in the journal of the file are replayed. Changes made after the last save are restored as one more action, so they show as unsaved, and can be undone.
         '''
 
         data = False
+        arrays = {}
 
         if self.is_empty() == True or force == True:
             # Reset the current cache
@@ -766,26 +2260,107 @@ class Curve_cache():
                 except json.JSONDecodeError as e:
                     # When something's wrong with the json file
                     pass
+            elif os.path.isfile(file_path) and file_path.endswith(PROJECT_EXTENSION):
+                try:
+                    data, arrays = read_project(file_path)
+                except Exception as e:
+                    logger.debug(e)
             else:
                 return -1
         elif self.is_empty() == False and force != True:
             return -2
 
+        if data == False:
+            return -1
+
         # Process the snapshot file
 
         # Identify snapshot file version
         isV2 = data.get('version', 1)
+        table_infos = {}    # Metadata of tables in binary project files, structure: {filename: info, ...}
 
-        if isV2 == 2:
+        if isV2 >= 2:
             assets = data['assets']
-            config.config = data['config']
+            # Version 2 files were written with a wrong key of config
+            self.snapshot_config = data.get('config', data.get('config.config', config.config))
+            if apply_config == True:
+                config.config = self.snapshot_config
             self.description = data['metadata'].get('notes')
+            table_infos = data.get('tables', {})
+            self._written_settings = json.loads(json.dumps({'config': self.snapshot_config, 'notes': self.description}))
         else:
             assets = data
 
+        # Replay changes journaled since the snapshot file was written
+        saved_assets = dict(assets)
+        current_assets = dict(assets)
+        for entry in read_journal(file_path + JOURNAL_SUFFIX):
+            for data_file, selection_list in entry.get('tables', {}).items():
+                if selection_list == None:
+                    current_assets.pop(data_file, None)
+                else:
+                    current_assets[data_file] = selection_list
+            if entry.get('save') == True:
+                saved_assets = dict(current_assets)
+        data_files = list(dict.fromkeys(list(saved_assets.keys()) + list(current_assets.keys())))
+
+        # Rebuild tables embedded in project file
+        # They hold only the selected samples, so they are not registered, and opening the .csv file again parses all of it. Caching that table replaces the embedded one, see self.cache().
+        tables = {}  # Structure: {filename: Table(), ...}
+        for data_file in data_files:
+            info = table_infos.get(data_file, {})
+            if 'arrays' in info:
+                table = registered_table(data_file)
+                if table == None:
+                    prefix = info['arrays'] + '_sample_'
+                    table_arrays = {int(name[len(prefix):]): array for name, array in arrays.items() if name.startswith(prefix)}
+                    try:
+                        table = Table(data_file, embedded = (info, table_arrays))
+                    except Exception as e:
+                        logger.error("Unable to load embedded data of %s: %s" % (data_file, e))
+                        continue
+                tables[data_file] = table
+
         # Load data to cache
+        # Only selected samples are used, so parse them on demand
+        pending = [data_file for data_file in data_files if data_file not in tables]
+        loaded, errors = load_tables(pending, progress = progress, lazy = True)
+        tables.update(zip(pending, loaded))
+
+        # The whole restoration process is treated as one action
+        with self.transaction():
+            self._cache_assets(saved_assets, tables)
+
+        # Mark the current status as "saved"
+        self._snapshot_saved_pos = self._pointer
+
+        if current_assets != saved_assets:
+            with self.transaction():
+                for data_file in saved_assets.keys():
+                    if data_file not in current_assets and tables[data_file] != None:
+                        self.remove(tables[data_file].id)
+                self._cache_assets({data_file: selection_list for data_file, selection_list in current_assets.items() if saved_assets.get(data_file) != selection_list}, tables)
+
+        # Set the current active snapshot file path, and keep journaling to it
+        self._working_snapshot_file = file_path
+        self._open_journal(file_path)
+
+        return 0
+            
+    def _cache_assets(self, assets, tables):
+
+        '''
+            Cache selections read from a snapshot file
+
+            assets: dict, structure: {filename: [[batch, subbatch, truncation], ...], ...}
+            tables: dict, structure: {filename: Table(), ...}
+        '''
+
         for data_file, selection_list in assets.items():
-            table = Table(data_file)
+            table = tables.get(data_file)
+            if table == None:
+                # Files failed to load have been logged, skip them
+                continue
 
             # Construct selection info in the format required by self.cache()
             selections = []
@@ -795,18 +2370,6 @@ class Curve_cache():
             # Cache items
             self.cache(table, selections)
 
-        # Compress snapshot stack, so the whole restoration process will be treated as one action
-        del self._snapshot[1 : len(self._snapshot) - 1]
-        self._pointer = 1
-
-        # Mark the current status as "saved"
-        self._snapshot_saved_pos = self._pointer
-
-        # Set the current active snapshot file path
-        self._working_snapshot_file = file_path
-
-        return 0
-            
     def get_table_obj(self, table_id):
 
         '''
@@ -815,6 +2378,21 @@ class Curve_cache():
 
         return self._ref_lut(table_id)
 
+    def get_regression(self, table_id, batch, subbatch, from_to = None):
+
+        '''
+        Linear regression of a curve over a strain window, in O(1) with the regression index of the curve
+
+        from_to: tuple, (from_x_equals_to_value, to_x_equals_to_value). If None, follows config['regression'].
+        Return value: tuple, (slope, intercept)
+        '''
+
+        table = self.lut[table_id]
+        truncate = self.cached[table_id][batch][subbatch]
+        length = len(table.get_curve_data(batch, subbatch, truncate_point = truncate))
+
+        return table.regression_index(batch, subbatch).fit(from_to, length = length)
+
     def get_curve(self, table_id, batch, subbatch):
 
         '''
@@ -830,6 +2408,172 @@ class Curve_cache():
         
 # Plotting function
 
+def _export_curve_figure(array, file_path, axis, dpi, image_format):
+
+    '''
+    Worker of export_curves(), render a single curve to an image file. An object-oriented Figure with the Agg canvas is used, so no pyplot state is shared between curves.
+    '''
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(array[:, 1]/axis['x_scaling'], array[:, 0]/axis['y_scaling'])
+    ax.axis(xmin=0, ymin=0)
+    ax.set(ylabel = 'Stress [%s]' % axis['y_unit'], xlabel = 'Strain [%s]' % axis['x_unit'])
+    fig.savefig(file_path, dpi = dpi, format = image_format, bbox_inches = 'tight')
+    return file_path
+
+def export_curves(curves_dict, lut, directory = '', dpi = None, image_format = None, workers = None):
+
+    '''
+    Render every curve to its own image file, named <table name>-<batch>-<subbatch>.<format>, with a process pool
+
+    curves_dict: A dict in the style of Curve_cache()._cache_status
+    lut: a dict for looking up references to table object by table_id
+    directory: string, directory to write images to, the current directory if empty
+    dpi: int, resolution of images. If None, follows config['export']['dpi'].
+    image_format: string, any format supported by matplotlib, e.g. 'png', 'svg', 'pdf'. If None, follows config['export']['format'].
+    workers: int, amount of worker processes. If None, follows config['parallel']['workers'], and defaults to the amount of CPU cores. Images are rendered in the current process if workers == 1.
+
+    Curves are decimated to the resolution of the image before being sent to workers, see decimate_curve(). Curves are submitted to the pool a few at a time, so memory use does not grow with the amount of curves.
+
+    Return value: tuple, (list of paths of written images, dict of exceptions raised when rendering, structure: {file_path: exception, ...})
+    '''
+
+    export_settings = config.config.get('export', {})
+    if dpi == None:
+        dpi = export_settings.get('dpi', 300)
+    if image_format == None:
+        image_format = export_settings.get('format', 'png')
+    if workers == None:
+        workers = config.config.get('parallel', {}).get('workers') or os.cpu_count() or 1
+
+    # Settings are passed to workers, as they do not share config with this process
+    axis = {key: config.config['axis'][key] for key in ('x_scaling', 'y_scaling', 'x_unit', 'y_unit')}
+    bins = Figure().get_figwidth() * dpi
+
+    def jobs():
+        for table_id, table_contents in curves_dict.items():
+            table = lut[table_id]
+            for batch, batch_contents in table_contents.items():
+                for subbatch, truncation in batch_contents.items():
+                    array = table.get_curve_data(batch, subbatch, truncation)
+                    if array is None:
+                        continue
+                    file_path = os.path.join(directory, '%s-%d-%d.%s' % (table.table_name, batch, subbatch, image_format))
+                    yield (decimate_curve(array, bins), file_path, axis, dpi, image_format)
+
+    written = []
+    errors = {}
+
+    if workers == 1:
+        for job in jobs():
+            try:
+                written.append(_export_curve_figure(*job))
+            except Exception as e:
+                errors[job[1]] = e
+    else:
+        job_iterator = jobs()
+        with ProcessPoolExecutor(max_workers = workers, mp_context = pool_context()) as executor:
+            # Keep a bounded window of curves in flight
+            pending = [(job[1], executor.submit(_export_curve_figure, *job)) for job in islice(job_iterator, workers * 2)]
+            while pending != []:
+                file_path, future = pending.pop(0)
+                for job in islice(job_iterator, 1):
+                    pending.append((job[1], executor.submit(_export_curve_figure, *job)))
+
+                try:
+                    written.append(future.result())
+                except Exception as e:
+                    errors[file_path] = e
+
+    for file_path, e in errors.items():
+        logger.error("Unable to export %s: %s" % (file_path, e))
+
+    return written, errors
+
+def _scaled_curves(curves_dict, lut, bins = None):
+
+    '''
+    Iterate over curves in curves_dict as strain/stress points scaled for plotting
+
+    curves_dict: A dict in the style of Curve_cache()._cache_status
+    lut: a dict for looking up references to table object by table_id
+    bins: int, optional. If given, curves are decimated with decimate_curve() before being scaled.
+
+    Return value: generator of tuples, (table, batch, subbatch, np.array([[strain, stress], ...]))
+    '''
+
+    x_scaling = config.config['axis']['x_scaling']
+    y_scaling = config.config['axis']['y_scaling']
+
+    for table_id, table_contents in curves_dict.items():
+        table = lut[table_id]
+        for batch, batch_contents in table_contents.items():
+            for subbatch, truncation in batch_contents.items():
+                array = table.get_curve_data(batch, subbatch, truncation)
+                if array is None:
+                    continue
+                if bins != None:
+                    array = decimate_curve(array, bins)
+                yield table, batch, subbatch, np.column_stack((array[:, 1]/x_scaling, array[:, 0]/y_scaling))
+
+def group_curves(curves, legend_group = None):
+
+    '''
+    Assign colors and legend entries to curves, one per curve, or one per group of curves from the same file or batch
+
+    curves: list of tuples, (table_name, batch, subbatch)
+    legend_group: string, 'curve', 'batch' or 'table'. Curves in the same group share a color and a legend entry. If None, follows config['plot']['legend_group'].
+
+    Colors are taken from the color cycle of matplotlib in the order groups first appear in curves.
+
+    Return value: tuple, (list of colors, one per curve, list of Line2D as legend handles, list of legend labels)
+    '''
+
+    if legend_group == None:
+        legend_group = config.config.get('plot', {}).get('legend_group', 'curve')
+    if legend_group not in ('curve', 'batch', 'table'):
+        logger.warning("Unknown legend group %s, curves are not grouped." % legend_group)
+        legend_group = 'curve'
+
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    group_colors = OrderedDict()    # Structure: {label: color, ...}
+    colors = []
+    for table_name, batch, subbatch in curves:
+        if legend_group == 'table':
+            label = table_name
+        elif legend_group == 'batch':
+            label = '%s-%s' % (table_name, batch)
+        else:
+            label = '%s-%s-%s' % (table_name, batch, subbatch)
+        if label not in group_colors:
+            group_colors[label] = cycle[len(group_colors) % len(cycle)]
+        colors.append(group_colors[label])
+
+    handles = [Line2D([], [], color=color) for color in group_colors.values()]
+    return colors, handles, list(group_colors.keys())
+
+def _output_plot(fig, curves_dict, lut, dpi, image_format, preview = False, filename = None, tight = True, suffix = ''):
+
+    '''
+    Show a pyplot figure in preview mode, or save it to file, see plot_array_cmd(). The figure is saved with fig.savefig(), as plt.savefig() draws the figure once more afterwards.
+
+    tight: bool, crop the saved image to its contents. Cropping lays out every axes once more, so it is turned off for figures with many axes.
+    suffix: string, appended to the default file name, so images of different compose modes do not overwrite each other
+    '''
+
+    bbox_inches = 'tight' if tight else None
+
+    if preview:
+        plt.show()
+    else:
+        if filename:
+            fig.savefig("%s.%s" % (filename, image_format), dpi=dpi, bbox_inches=bbox_inches)
+        else:
+            first_table = lut[list(curves_dict.keys())[0]]
+            fig.savefig("%s%s.%s" % (os.path.splitext(first_table.file_name)[0], suffix, image_format), dpi=dpi, bbox_inches=bbox_inches)
+
 def plot_array_cmd(curves_dict, lut, compose_mode = None, **kwargs):
 
     '''
@@ -846,26 +2590,35 @@ def plot_array_cmd(curves_dict, lut, compose_mode = None, **kwargs):
         - sub_width: int, specifies how many subplots should be in a row
         - legends: bool, switch on/off legends
         - preview: bool, use preview mode
+        - filename: string, file name of the image without extension, or the directory of images in 'alone' mode
+        - collection: bool, in 'combined' mode, draw all curves as one LineCollection, which is much faster for hundreds of curves. If None, curves are drawn as a collection when there are at least config['plot']['collection_threshold'] of them.
+        - legend_group: string, 'curve', 'batch' or 'table', one color and legend entry for each curve, batch or file, see group_curves()
+        - dpi: int, resolution of images, see export_curves()
+        - image_format: string, format of images, see export_curves()
     '''
 
+    dpi = kwargs.get('dpi') or config.config.get('export', {}).get('dpi', 300)
+    image_format = kwargs.get('image_format') or config.config.get('export', {}).get('format', 'png')
+
     if compose_mode == 'combined' or compose_mode == None:
         fig = plt.figure()
         main_plt = fig.add_axes([0.1, 0.15, 0.7, 0.7])
 
-        legend_list = []
-
-        # Plot arrays in curves_list
-        for table_id, table_contents in curves_dict.items():
-
-            table = lut[table_id]
+        curves = list(_scaled_curves(curves_dict, lut))
+        colors, legend_handles, legend_list = group_curves([(table.table_name, batch, subbatch) for table, batch, subbatch, points in curves], kwargs.get('legend_group'))
 
-            for batch, batch_contents in table_contents.items():
-                for subbatch, truncation in batch_contents.items():
+        collection = kwargs.get('collection')
+        if collection == None:
+            collection_threshold = config.config.get('plot', {}).get('collection_threshold')
+            collection = collection_threshold != None and len(curves) >= collection_threshold
 
-                    array = table.get_curve_data(batch, subbatch, truncation)
-                    legend_text = table.table_name + '-' + str(batch) + '-' +  str(subbatch)
-                    legend_list.append(legend_text)
-                    main_plt.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
+        # Plot curves, either as one collection, or as one line each
+        if collection:
+            main_plt.add_collection(LineCollection([points for table, batch, subbatch, points in curves], colors=colors))
+            main_plt.autoscale_view()
+        else:
+            for (table, batch, subbatch, points), color in zip(curves, colors):
+                main_plt.plot(points[:, 0], points[:, 1], color=color)
 
         # Set axis labels 
         main_plt.axis(xmin=0, ymin=0)
@@ -876,33 +2629,183 @@ def plot_array_cmd(curves_dict, lut, compose_mode = None, **kwargs):
         if kwargs.get('legends') or kwargs.get('preview'):              
             box = main_plt.get_position()
             main_plt.set_position([box.x0, box.y0, box.width*0.65, box.height])
-            main_plt.legend(legend_list, bbox_to_anchor=(1.05,1), borderaxespad=0.)
+            main_plt.legend(legend_handles, legend_list, bbox_to_anchor=(1.05,1), borderaxespad=0.)
 
         # Output the plot, either show or save to file
-        if kwargs.get('preview'):
-            plt.show()
-        else:
-            if kwargs.get('filename'):
-                plt.savefig("%s.png" % kwargs.get('filename'), bbox_inches='tight')
-            else:
-                plt.savefig("%s.png" % str.split(curves_list[0].table.file_name, '.')[-2], bbox_inches='tight')
+        _output_plot(fig, curves_dict, lut, dpi, image_format, kwargs.get('preview'), kwargs.get('filename'))
 
     elif compose_mode == 'alone':
-        for index, curve in curves_list.items():
-            array = curve.get_data()
-            plt.figure(i)
-            plt.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
-            plt.axis(xmin=0, ymin=0)
-            plt.ylabel('Stress [%s]' % config.config.get('axis').get('y_unit'))
-            plt.xlabel('Strain [%s]' % config.config.get('axis').get('x_unit'))
-            plt.savefig(str(curve) + '.png')
+        written, errors = export_curves(curves_dict, lut, directory = kwargs.get('filename') or '', dpi = dpi, image_format = image_format, workers = kwargs.get('workers'))
+        logger.info("%d images written." % len(written))
     elif compose_mode == 'sub':
-        pass
+        sub_width = kwargs.get('sub_width') or 4
+        subplot_size = (2.0, 1.6)    # Size of each subplot in inches
+
+        # Every subplot is only a few hundred pixels wide, so curves are decimated to that width
+        curves = list(_scaled_curves(curves_dict, lut, bins = subplot_size[0] * dpi))
+        if curves == []:
+            logger.warning("No curve to plot.")
+            return
+
+        rows = -(-len(curves) // sub_width)
+        width, height = subplot_size[0] * sub_width + 0.8, subplot_size[1] * rows + 0.6
+        fig, axes = plt.subplots(rows, sub_width, sharex=True, sharey=True, squeeze=False, figsize=(width, height))
+
+        # Margins and title positions are fixed, as laying out and cropping a figure of many axes costs more than drawing the curves
+        fig.subplots_adjust(left=0.7/width, right=1-0.1/width, bottom=0.5/height, top=1-0.3/height, wspace=0.08, hspace=0.25)
+
+        # One collection per subplot, drawn in a single pass when the figure is saved
+        for ax, (table, batch, subbatch, points) in zip(axes.flat, curves):
+            ax.add_collection(LineCollection([points], linewidths=0.8))
+            ax.set_title('%s-%d-%d' % (table.table_name, batch, subbatch), fontsize='small', y=1.0, pad=2)
+            ax.tick_params(labelsize='x-small')
+
+        # Hide empty subplots in the last row, and show x tick labels on subplots above them instead
+        for index in range(len(curves), rows * sub_width):
+            axes.flat[index].set_visible(False)
+            if rows > 1:
+                axes.flat[index - sub_width].xaxis.set_tick_params(labelbottom=True)
+
+        # Axes are shared, so limits are only set once
+        x_max = max(points[:, 0].max() for table, batch, subbatch, points in curves)
+        y_max = max(points[:, 1].max() for table, batch, subbatch, points in curves)
+        axes[0, 0].set_xlim(0, x_max * 1.05)
+        axes[0, 0].set_ylim(0, y_max * 1.05)
+        fig.text(0.5, 0.05/height, 'Strain [%s]' % config.config.get('axis').get('x_unit'), ha='center', va='bottom', fontsize='large')
+        fig.text(0.05/width, 0.5, 'Stress [%s]' % config.config.get('axis').get('y_unit'), ha='left', va='center', rotation='vertical', fontsize='large')
+
+        _output_plot(fig, curves_dict, lut, dpi, image_format, kwargs.get('preview'), kwargs.get('filename'), tight = False, suffix = '-sub')
     else:
         logger.error("Incorrect compose_mode.")
 
 
 
+# Batch analysis
+
+BATCH_FIELDS = ['file', 'table', 'batch', 'subbatch', 'ym', 'uts', 'sams', 'sab', 'toughness']   # Columns of batch analysis output
+
+def expand_paths(patterns):
+
+    '''
+    Expand directories and glob patterns to a sorted list of .csv files
+
+    patterns: list of strings, each being a .csv file, a directory (all .csv files directly inside will be used), or a glob pattern (`**` is supported)
+    '''
+
+    file_paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            file_paths.extend(sorted(glob.glob(os.path.join(glob.escape(pattern), '*.csv'))))
+        else:
+            file_paths.extend(sorted(glob.glob(pattern, recursive = True)))
+
+    # Drop duplicates, keep order
+    return list(dict.fromkeys(file_paths))
+
+def analyze_file(file_path):
+
+    '''
+    Analyze every sample in a .csv file
+
+    Return value: list of dicts, one for each sample, with keys in BATCH_FIELDS. Stress values are in config['axis']['y_unit'], strain values are in config['axis']['x_unit'].
+    '''
+
+    # Every file is read once, so writing a sidecar next to it would only cost time and disk space
+    table = Table(file_path, sidecar = False)
+    rows = []
+
+    samples = [(batch, subbatch) for batch in range(1, table.batch_count+1) for subbatch in range(1, table.subbatch_count+1) if table.has_sample(batch, subbatch)]
+    # Regression indices are built by analyze_curves() only if they are needed
+    metrics = analyze_curves([table.get_curve_data(batch, subbatch) for batch, subbatch in samples])
+
+    for i, (batch, subbatch) in enumerate(samples):
+        rows.append({
+            'file': file_path,
+            'table': table.table_name,
+            'batch': batch,
+            'subbatch': subbatch,
+            'ym': float(metrics['ym'][i])/config.config["axis"]["y_scaling"],
+            'uts': float(metrics['uts'][i])/config.config["axis"]["y_scaling"],
+            'sams': float(metrics['sams'][i])/config.config["axis"]["x_scaling"],
+            'sab': float(metrics['sab'][i])/config.config["axis"]["x_scaling"],
+            'toughness': float(metrics['toughness'][i])
+        })
+
+    return rows
+
+def batch_analyze(patterns, output, output_format = 'csv', workers = None):
+
+    '''
+    Analyze every sample in many .csv files with a process pool, and stream one result row per sample to output
+
+    patterns: list of files, directories or glob patterns, see expand_paths()
+    output: a writable text file object
+    output_format: string, 'csv' or 'jsonl' (JSON Lines)
+    workers: int, amount of worker processes. If None, follows config['parallel']['workers'], and defaults to the amount of CPU cores. Files are analyzed in the current process if workers == 1.
+
+    Rows are written in the order of files as soon as each file is done, and files are submitted to the pool a few at a time, so memory use does not grow with the amount of files.
+
+    Return value: tuple, (amount of rows written, dict of exceptions raised when analyzing files, structure: {file_path: exception, ...})
+    '''
+
+    if workers == None:
+        workers = config.config.get('parallel', {}).get('workers') or os.cpu_count() or 1
+
+    file_paths = iter(expand_paths(patterns))
+    errors = {}
+    row_count = 0
+
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, fieldnames = BATCH_FIELDS)
+        writer.writeheader()
+        write_row = writer.writerow
+    elif output_format == 'jsonl':
+        # NaN is not valid JSON, values that could not be calculated are written as null
+        write_row = lambda row: output.write(json.dumps({key: None if isinstance(value, float) and math.isnan(value) else value for key, value in row.items()}) + '\n')
+    else:
+        raise ValueError("Unknown output format: %s" % output_format)
+
+    def results():
+
+        '''
+        Analyze files in order, yield (file path, rows or the exception raised)
+        '''
+
+        if workers == 1:
+            for file_path in file_paths:
+                try:
+                    yield file_path, analyze_file(file_path)
+                except Exception as e:
+                    yield file_path, e
+            return
+
+        with ProcessPoolExecutor(max_workers = workers, mp_context = pool_context()) as executor:
+            # Keep a bounded window of files in flight
+            pending = [(file_path, executor.submit(analyze_file, file_path)) for file_path in islice(file_paths, workers * 2)]
+            while pending != []:
+                file_path, future = pending.pop(0)
+                for next_file_path in islice(file_paths, 1):
+                    pending.append((next_file_path, executor.submit(analyze_file, next_file_path)))
+
+                try:
+                    yield file_path, future.result()
+                except Exception as e:
+                    yield file_path, e
+
+    for file_path, rows in results():
+        if isinstance(rows, Exception):
+            logger.error("Unable to analyze %s: %s" % (file_path, rows))
+            errors[file_path] = rows
+            continue
+
+        for row in rows:
+            write_row(row)
+        row_count += len(rows)
+        output.flush()
+
+    return row_count, errors
+
+
 # Command line mode main processing flow
 if __name__ == "__main__":
 
@@ -915,7 +2818,17 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--legend", help="Switch on/off legends", action="store_true")
     parser.add_argument("-c", "--compose_mode", help="Specifies how to organize plotted curves of different samples. Available options: combined, alone, sub")
     parser.add_argument("-s", "--select", help="Specifies which samples are to be plotted. Format: batch-subbatch(-truncate_percentage),batch-subbatch")
+    parser.add_argument("-g", "--legend_group", help="Group curves in legends, one color and legend entry for each: curve, batch, table. Default: curve")
+    parser.add_argument("--sub_width", type=int, help="Amount of subplots in a row, in sub compose mode. Default: 4")
+    parser.add_argument("--dpi", type=int, help="Resolution of images. Default: 300")
+    parser.add_argument("--image_format", help="Format of images, e.g. png, svg, pdf. Default: png")
     # parser.add_argument("-r", "--slope_range", help="Specifies the range of data for slope/modulus measurement. Format: start_strain,end_strain")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Analyze every sample in many files, and write one result row per sample")
+    batch_parser.add_argument("paths", nargs="+", help="Files, directories or glob patterns of .csv files to be analyzed")
+    batch_parser.add_argument("-o", "--output", help="Specifies the output file. Default: standard output")
+    batch_parser.add_argument("--format", help="Output format: csv, jsonl. Default: jsonl if output file ends with .jsonl, otherwise csv")
+    batch_parser.add_argument("-w", "--workers", type=int, help="Amount of worker processes. Default: amount of CPU cores")
     args = parser.parse_args()
 
     # Logging settings
@@ -941,13 +2854,29 @@ if __name__ == "__main__":
     font = config.config['font']
     plt.rc('font', **font)
 
-    if args.interactive != True and args.file:
+    if args.command == "batch":
+
+        # Batch mode processing flow
+
+        output_format = args.format
+        if output_format == None:
+            output_format = 'jsonl' if args.output and args.output.endswith('.jsonl') else 'csv'
+
+        if args.output:
+            with open(args.output, 'w', newline='') as output:
+                row_count, errors = batch_analyze(args.paths, output, output_format, workers=args.workers)
+        else:
+            row_count, errors = batch_analyze(args.paths, sys.stdout, output_format, workers=args.workers)
+
+        logger.info("%d samples analyzed, %d files failed." % (row_count, len(errors)))
+
+    elif args.interactive != True and args.file:
 
         # Command line mode processing flow
 
         if os.path.isfile(args.file):
             try:
-                table = Table(args.file)
+                table = open_table(args.file)
             except Exception as e:
                 logger.error(str(e))
                 sys.exit()
@@ -961,7 +2890,7 @@ if __name__ == "__main__":
             cache.cache(table)
 
         analyze_result = cache.analyze()
-        plot_array_cmd(cache.cached, cache.lut, compose_mode=args.compose_mode, legends = args.legend)
+        plot_array_cmd(cache.cached, cache.lut, compose_mode=args.compose_mode, legends = args.legend, legend_group = args.legend_group, sub_width = args.sub_width, dpi = args.dpi, image_format = args.image_format)
 
     elif args.interactive == True:
 
@@ -972,22 +2901,30 @@ if __name__ == "__main__":
 
             if main_operation == 'open':
                 while(True): 
-                    filename = input("Enter file name, or press enter to return:\n")
-                    if os.path.isfile(filename):
-                        working_table = Table(filename)             
-                        select_str = input("Select data of samples, or input 'all' to select all. Format: batch-subbatch-truncate_at, batch-subbatch,... Press enter to return\n")
-                        if select_str == 'all' or select_str == '':
-                            cache.cache(working_table)
-                            print("Data of all samples has been successfully cached.")
-                        else:                   
-                            cache.cache_s(working_table, select_str)
-                            print("Selection has been successfully cached.")
-                    elif filename == '':
+                    filename_input = input("Enter file name(s) separated by ';', or press enter to return:\n")
+                    if filename_input == '':
                         break
-                    else:
-                        logger.error("File not found: %s" % filename)
+
+                    filenames = [filename.strip() for filename in filename_input.split(';') if filename.strip() != '']
+                    missing = [filename for filename in filenames if not os.path.isfile(filename)]
+                    if missing != []:
+                        logger.error("File not found: %s" % ', '.join(missing))
                         continue
 
+                    # Load all files at once, then select samples of each file, as one action
+                    working_tables, errors = load_tables(filenames)
+                    with cache.transaction():
+                        for working_table in working_tables:
+                            if working_table == None:
+                                continue
+                            select_str = input("Select data of samples in %s, or input 'all' to select all. Format: batch-subbatch-truncate_at, batch-subbatch,... Press enter to return\n" % working_table.table_name)
+                            if select_str == 'all' or select_str == '':
+                                cache.cache(working_table)
+                                print("Data of all samples has been successfully cached.")
+                            else:                   
+                                cache.cache_s(working_table, select_str)
+                                print("Selection has been successfully cached.")
+
             elif main_operation == 'exit':
                 print("Exit now.")
                 break
@@ -1005,15 +2942,18 @@ if __name__ == "__main__":
                 
                 compose_mode = 'combined'
                 while(True):
-                    compose_mode_input = input("Input compose mode (default = combined). combined/alone\n")
+                    compose_mode_input = input("Input compose mode (default = combined). combined/alone/sub\n")
                     if compose_mode_input == 'combined' or compose_mode_input == '':
                         legend = True
                         break
                     elif compose_mode_input == 'alone':
                         compose_mode = 'alone'
                         break
+                    elif compose_mode_input == 'sub':
+                        compose_mode = 'sub'
+                        break
                     else:
-                        print("Type combined/alone .\n")            
+                        print("Type combined/alone/sub .\n")            
                 plot_array_cmd(cache.cached, cache.lut, compose_mode = compose_mode, legends = legend)
                         
             elif main_operation =='analysis':
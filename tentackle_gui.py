@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # TenTackle_GUI: Simple GUI for TenTackle
 
-import os, sys, logging
+import os, sys, logging, threading
 import wx
 import wx.lib.newevent
 import numpy as np
@@ -9,7 +9,7 @@ import matplotlib
 from matplotlib import pyplot as plt
 # import ObjectListViewgit 
 
-from main import Table, Curve_cache
+from main import Table, Curve_cache, open_table, decimate_curve, group_curves, PROJECT_EXTENSION
 import config
 
 matplotlib.interactive(False)
@@ -17,6 +17,7 @@ matplotlib.use("WXAgg")
 from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg
 from matplotlib.backends.backend_wx import NavigationToolbar2Wx
 from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 
 
 
@@ -36,7 +37,9 @@ class CanvasPanel(wx.Panel):
             'y_unit': config.config.get('axis').get('y_unit'),
             'x_scaling': config.config['axis']['x_scaling'],
             'y_scaling': config.config['axis']['y_scaling'],
-            'title': ''
+            'title': '',
+            'collection_threshold': config.config.get('plot', {}).get('collection_threshold'),
+            'legend_group': config.config.get('plot', {}).get('legend_group', 'curve')
         }
 
         if isinstance(kw.get('params'), dict):
@@ -49,6 +52,11 @@ class CanvasPanel(wx.Panel):
         self.ax.axis(xmin=0, ymin=0)
         self.canvas = FigureCanvasWxAgg(self, wx.ID_ANY, self.figure)
 
+        # Curves are drawn decimated to the resolution of the canvas, and decimated again when the visible range changes
+        self._artists = {}  # Lines of drawn curves and their full data, structure: {(table_id, batch, subbatch, truncation): (Line2D, array, x_scaling, y_scaling), ...}
+        self._collection = None     # When many curves are drawn, they are drawn as this single LineCollection instead, and Line2D in self._artists are None
+        self._xlim_callback = self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
 
 
         self.sizer = wx.BoxSizer(wx.VERTICAL)
@@ -73,63 +81,158 @@ class CanvasPanel(wx.Panel):
 
             - cache: `Curve_cache`, a curve cache with all the curves
             - selection:  `list`, a list containing selection, format: [{table_id: table_id_1, batch: batch_1, curve: curve_1}, ...]. If selection is provided, table_id will be ignored.
-        ''' 
-        
-        self.clear()
 
+            Lines already on the figure are kept, only lines of curves added, removed or truncated since the last call are changed. If there are at least params['collection_threshold'] curves, all curves are drawn as one LineCollection instead.
+        ''' 
 
         self.ax.set_xlabel('Strain [%s]' % config.config['axis']['x_unit'], fontsize=self.params['fontsize'])
         self.ax.set_ylabel('Stress [%s]' % config.config['axis']['y_unit'], fontsize=self.params['fontsize'])
-        self.ax.set_title = (self.params['title'])
+        self.ax.set_title(self.params['title'])
 
-        legend_list = []
+        # Find curves to draw
+        curves = []  # Structure: [(table_id, batch, subbatch), ...]
         if selections:
             for selection in selections:
-                table_id = selection['table_id']
-                batch = selection['batch']
-                subbatch = selection['subbatch']
-                array = cache.get_curve(table_id, batch, subbatch)
-                legend_text = cache.lut[table_id].table_name
-                if self.params['numbering']:
-                    legend_text = legend_text  + '-' + str(batch) + '-' +  str(subbatch)
-                legend_list.append(legend_text)
-                self.ax.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
+                curves.append((selection['table_id'], selection['batch'], selection['subbatch']))
         elif table_id:   # If no selections, go through the whole table specified by table_id
             for batch in cache.cached[table_id].keys():
                 for subbatch in cache.cached[table_id][batch]:
-                    array = cache.get_curve(table_id, batch, subbatch)
-                    legend_text = cache.lut[table_id].table_name
-                    if self.params['numbering']:
-                        legend_text = legend_text  + '-' + str(batch) + '-' +  str(subbatch)
-                    legend_list.append(legend_text)
-                    self.ax.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
+                    curves.append((table_id, batch, subbatch))
         else:   # If nothing was specified, draw everything in cache
             for table_id in cache.cached.keys():
                 for batch in cache.cached[table_id].keys():
                     for subbatch in cache.cached[table_id][batch]:
-                        array = cache.get_curve(table_id, batch, subbatch)
-                        legend_text = cache.lut[table_id].table_name
-                        if self.params['numbering']:
-                            legend_text = legend_text  + '-' + str(batch) + '-' +  str(subbatch)
-                        legend_list.append(legend_text)
-                        self.ax.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
-
-        # else:
-        #     for index in selection:
-        #         curve = curves_list[index]
-        #         array = curve.get_data()
-        #         legend_list.append(str(curve))
-        #         self.ax.plot(array[:, 1]/config.config['axis']['x_scaling'], array[:, 0]/config.config['axis']['y_scaling'])
+                        curves.append((table_id, batch, subbatch))
+
+        keys = [(table_id, batch, subbatch, cache.cached[table_id][batch][subbatch]) for table_id, batch, subbatch in curves]
+        scaling = (config.config['axis']['x_scaling'], config.config['axis']['y_scaling'])
+
+        # Switch between lines and a collection, everything is drawn again then
+        changed = False
+        collection_threshold = self.params['collection_threshold']
+        use_collection = collection_threshold != None and len(keys) >= collection_threshold
+        if use_collection != (self._collection != None):
+            for key in list(self._artists.keys()):
+                self.remove_curve(key)
+            if self._collection != None:
+                self._collection.remove()
+                self._collection = None
+            if use_collection:
+                self._collection = LineCollection([])
+                self.ax.add_collection(self._collection)
+            changed = True
+
+        # Remove lines no longer wanted, or drawn with other settings
+        for key in list(self._artists.keys()):
+            line, array, x_scaling, y_scaling = self._artists[key]
+            if key not in keys or (x_scaling, y_scaling) != scaling:
+                self.remove_curve(key)
+                changed = True
+
+        # Add new lines
+        for key in keys:
+            table_id, batch, subbatch, truncate_point = key
+            if key not in self._artists:
+                self.plot_curve(key, cache.get_curve(table_id, batch, subbatch))
+                changed = True
+
+        # Colors follow legend groups, so they are set again for all curves
+        legend_group = self.params['legend_group'] if self.params['numbering'] else 'table'
+        colors, legend_handles, legend_list = group_curves([(cache.lut[key[0]].table_name, key[1], key[2]) for key in keys], legend_group)
+        colors = dict(zip(keys, colors))
+        if self._collection != None:
+            self._collection.set_colors([colors[key] for key in self._artists.keys()])
+        else:
+            for key, (line, array, x_scaling, y_scaling) in self._artists.items():
+                line.set_color(colors[key])
+
+        if changed:
+            # Limits are fitted to the full curves, not only to the part visible now
+            self.decimate(self.resolution())
+            self.ax.relim()
+            if self._collection != None and self._artists != {}:
+                # relim() leaves out collections
+                self.ax.update_datalim(np.concatenate(self._collection.get_segments()))
+            self.ax.autoscale_view()
+            # Limits set by zooming are kept
+            self.decimate(self.resolution(), self.ax.get_xlim())
 
-        
-        
         # self.ax.legend(legend_list, bbox_to_anchor=(1.05,1), borderaxespad=0.)
         # Quick hack for auto placing the legend, but should be fixed in the future.
-        self.ax.legend(legend_list)
+        if keys != []:
+            self.ax.legend(legend_handles, legend_list)
+        elif self.ax.get_legend() != None:
+            self.ax.get_legend().remove()
 
-        self.canvas.draw()
+        self.canvas.draw_idle()
         self.Layout()
 
+    def plot_curve(self, key, array):
+
+        '''
+            Plot a curve, decimated to the resolution of the canvas. The full array is kept, so the curve can be decimated again for another visible range or resolution. If curves are drawn as a collection, the curve is only added to the collection in the next call of decimate().
+
+            key: tuple, (table_id, batch, subbatch, truncation)
+            array: np.array([[stress, strain], ...]), as returned by Curve_cache.get_curve()
+        '''
+
+        x_scaling = config.config['axis']['x_scaling']
+        y_scaling = config.config['axis']['y_scaling']
+        if self._collection != None:
+            self._artists[key] = (None, array, x_scaling, y_scaling)
+            return
+        shown = decimate_curve(array, self.resolution())
+        line, = self.ax.plot(shown[:, 1]/x_scaling, shown[:, 0]/y_scaling)
+        self._artists[key] = (line, array, x_scaling, y_scaling)
+
+    def remove_curve(self, key):
+
+        '''
+            Remove a plotted curve. If curves are drawn as a collection, the curve is only removed from the collection in the next call of decimate().
+
+            key: tuple, (table_id, batch, subbatch, truncation)
+        '''
+
+        line = self._artists.pop(key)[0]
+        if line != None:
+            line.remove()
+
+    def resolution(self):
+
+        '''
+            Width of the axes in pixels
+        '''
+
+        return max(int(self.ax.bbox.width), 100)
+
+    def decimate(self, bins, x_range = None):
+
+        '''
+            Replace data of drawn lines with their full curves, decimated to a given resolution and visible range
+
+            bins: int, resolution in pixels
+            x_range: tuple, (min, max) of the x axis, optional
+        '''
+
+        segments = []
+        for line, array, x_scaling, y_scaling in self._artists.values():
+            if x_range != None:
+                shown = decimate_curve(array, bins, (x_range[0] * x_scaling, x_range[1] * x_scaling))
+            else:
+                shown = decimate_curve(array, bins)
+            if line != None:
+                line.set_data(shown[:, 1]/x_scaling, shown[:, 0]/y_scaling)
+            else:
+                segments.append(np.column_stack((shown[:, 1]/x_scaling, shown[:, 0]/y_scaling)))
+
+        if self._collection != None:
+            self._collection.set_segments(segments)
+
+    def on_xlim_changed(self, ax):
+
+        # Zooming and panning only changes limits, so only the visible range is decimated again
+        self.decimate(self.resolution(), ax.get_xlim())
+
     def clear(self):
 
         '''
@@ -137,11 +240,22 @@ class CanvasPanel(wx.Panel):
         '''
 
         self.ax.clear()
-        self.canvas.draw()
+        self._artists = {}
+        self._collection = None
+
+        # Clearing the axes drops its callbacks
+        self.ax.callbacks.disconnect(self._xlim_callback)
+        self._xlim_callback = self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
+        self.canvas.draw_idle()
 
     def save(self, save_path):
-        
-        self.figure.savefig(save_path, dpi=300, bbox_inches='tight')
+
+        # Saved images have a higher resolution than the canvas
+        dpi = 300
+        self.decimate(self.resolution() * dpi / self.figure.dpi, self.ax.get_xlim())
+        self.figure.savefig(save_path, dpi=dpi, bbox_inches='tight')
+        self.decimate(self.resolution(), self.ax.get_xlim())
 
     def update_params(self, params):
 
@@ -188,6 +302,236 @@ class Console(wx.Panel):
         
 
 
+def render_thumbnail(array, width, height, color = (31, 119, 180)):
+
+    '''
+        Render a stress/strain curve to a small RGB image with numpy only, so it can be done in a worker thread. Every pixel column is filled between the lowest and highest point of the curve in it, and the point before them.
+
+        array: np.array([[stress, strain], ...])
+        width, height: int, size of the image in pixels
+        color: tuple, RGB color of the curve
+
+        Return value: np.array of uint8, shape (height, width, 3)
+    '''
+
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    array = decimate_curve(array, width)
+    array = array[np.isfinite(array).all(axis=1)]
+    if len(array) == 0:
+        return image
+
+    x = array[:, 1]
+    y = array[:, 0]
+    x_span = (x.max() - x.min()) or 1
+    y_span = (y.max() - y.min()) or 1
+    columns = ((x - x.min()) / x_span * (width - 1)).astype(np.intp)
+    rows = ((y.max() - y) / y_span * (height - 1)).astype(np.intp)   # Row 0 is the top of the image
+
+    top = np.full(width, height, dtype=np.intp)
+    bottom = np.full(width, -1, dtype=np.intp)
+    np.minimum.at(top, columns, rows)
+    np.maximum.at(bottom, columns, rows)
+    # Connect every point to the previous one, so steep parts have no gaps
+    np.minimum.at(top, columns[1:], rows[:-1])
+    np.maximum.at(bottom, columns[1:], rows[:-1])
+
+    pixel_rows = np.arange(height)[:, None]
+    image[(pixel_rows >= top[None, :]) & (pixel_rows <= bottom[None, :])] = color
+    return image
+
+
+class Curve_list(wx.ListCtrl):
+
+    '''
+        Virtual list of curves in a Curve_cache. Texts of rows are not stored in the control, but read from the cache when rows are shown, so the cost of updating the list does not grow with the amount of rows shown.
+    '''
+
+    # Titles of columns that can be shown
+    titles = {
+        'index': 'Index',
+        'sample': 'Sample',
+        'batch': 'Batch',
+        'subbatch': 'Subbatch',
+        'truncation': 'Truncation%'
+    }
+
+    def __init__(self, *args, **kw):
+
+        '''
+            fields: list of columns to show, keys of Curve_list.titles
+            thumbnail_size: tuple, optional, (width, height) of thumbnails shown in the first column, see self.set_thumbnail()
+        '''
+
+        self.fields = kw.pop('fields')
+        self.thumbnail_size = kw.pop('thumbnail_size', None)
+        kw['style'] = kw.get('style', 0) | wx.LC_REPORT | wx.LC_VIRTUAL
+
+        super(Curve_list, self).__init__(*args, **kw)
+
+        for column, field in enumerate(self.fields):
+            self.InsertColumn(column, self.titles[field])
+
+        self._thumbnails = {}   # Index of thumbnail of curves in self._images, structure: {(table_id, batch, subbatch): index, ...}
+        self._images = None
+        if self.thumbnail_size != None:
+            self._images = wx.ImageList(*self.thumbnail_size)
+            self.SetImageList(self._images, wx.IMAGE_LIST_SMALL)
+
+        self.cache = None
+        self._table_id = None
+        self._revision = None   # Revision of the cache the rows were built from
+        self._rows = []  # Curves shown, structure: [(table_id, batch, subbatch), ...]
+        self._row_of = {}   # Row of each curve shown, structure: {(table_id, batch, subbatch): row, ...}
+
+    def update(self, cache, table_id = None):
+
+        '''
+            Show curves in a cache
+
+            cache: Curve_cache
+            table_id: str, optional, only show curves of this table
+        '''
+
+        if cache is not self.cache or table_id != self._table_id or cache.revision != self._revision:
+            self.cache = cache
+            self._table_id = table_id
+            self._revision = cache.revision
+            if table_id != None:
+                status = {table_id: cache.cached.get(table_id, {})}
+            else:
+                status = cache.cached
+            self._rows = [(table_id, batch, subbatch) for table_id, table_contents in status.items() for batch, batch_contents in table_contents.items() for subbatch in batch_contents.keys()]
+            self._row_of = {curve: row for row, curve in enumerate(self._rows)}
+            self.SetItemCount(len(self._rows))
+
+        # Only rows in view are painted again
+        self.Refresh()
+
+    def set_thumbnail(self, curve, bitmap):
+
+        '''
+            Show a thumbnail for a curve
+
+            curve: tuple, (table_id, batch, subbatch)
+            bitmap: wx.Bitmap of self.thumbnail_size
+        '''
+
+        self._thumbnails[curve] = self._images.Add(bitmap)
+        if curve in self._row_of:
+            self.RefreshItem(self._row_of[curve])
+
+    def clear_thumbnails(self):
+
+        if self._images != None:
+            self._images.RemoveAll()
+        self._thumbnails = {}
+
+    def curve_at(self, row):
+
+        '''
+            Return value: tuple, (table_id, batch, subbatch) of the curve shown in a row
+        '''
+
+        return self._rows[row]
+
+    def OnGetItemImage(self, item):
+
+        return self._thumbnails.get(self._rows[item], -1)
+
+    def OnGetItemText(self, item, column):
+
+        table_id, batch, subbatch = self._rows[item]
+        field = self.fields[column]
+
+        if field == 'index':
+            return "%s %s %s" % (table_id, batch, subbatch)
+        elif field == 'sample':
+            return self.cache.lut[table_id].table_name
+        elif field == 'batch':
+            return str(batch)
+        elif field == 'subbatch':
+            return str(subbatch)
+        elif field == 'truncation':
+            truncate_point = self.cache.cached.get(table_id, {}).get(batch, {}).get(subbatch, -1)
+            if truncate_point == -1:
+                return '-'
+            return str(truncate_point)
+        return ''
+
+
+class Background_task():
+
+    '''
+        Run a slow job (parsing, restoring, analysis) in a worker thread, so the window stays responsive. The result is delivered to the wx event thread with wx.CallAfter().
+
+        The job is a callable taking the task as its only argument. It may report progress with task.report(), and should stop as soon as task.cancelled is set.
+    '''
+
+    def __init__(self, job, on_done, on_error = None, on_cancelled = None):
+
+        '''
+            job: callable, job(task), runs in the worker thread and returns the result
+            on_done: callable, on_done(result), called in the event thread when the job has finished
+            on_error: callable, on_error(exception), called in the event thread when the job has raised an exception
+            on_cancelled: callable, on_cancelled(result), called in the event thread when a cancelled job has finished, for cleaning up its result
+        '''
+
+        self.job = job
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.done = 0   # Progress reported by the job, read by the event thread
+        self.total = 0  # 0 if the amount of work is unknown
+        self.finished = False
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def start(self):
+
+        threading.Thread(target = self._run, name = 'background task', daemon = True).start()
+
+    def cancel(self):
+
+        self._cancelled.set()
+
+    def report(self, done, total):
+
+        '''
+            Report progress from the worker thread
+
+            Return value: bool, False if the task has been cancelled, so it can be used as progress callback of load_tables()
+        '''
+
+        self.done = done
+        self.total = total
+        return not self.cancelled
+
+    def _run(self):
+
+        try:
+            result = self.job(self)
+        except Exception as e:
+            wx.CallAfter(self._finish, None, e)
+        else:
+            wx.CallAfter(self._finish, result, None)
+
+    def _finish(self, result, error):
+
+        self.finished = True
+        if self.cancelled:
+            if self.on_cancelled != None and error == None:
+                self.on_cancelled(result)
+        elif error != None:
+            if self.on_error != None:
+                self.on_error(error)
+        else:
+            self.on_done(result)
+
+
 class Import_dialog(wx.Dialog):
 
     def __init__(self, *args, **kw):
@@ -200,6 +544,8 @@ class Import_dialog(wx.Dialog):
 
         self.table = None
         self.file_path = None
+        self.preview = Curve_cache(name = 'preview')   # Staging cache for previewing, the main cache is only changed when OK is clicked
+        self._thumbnail_generation = 0  # Incremented when thumbnails being rendered are no longer wanted
         
         self.main_sizer = wx.BoxSizer(wx.VERTICAL)
         self.top_h_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -217,12 +563,8 @@ class Import_dialog(wx.Dialog):
         self.selection_label = wx.StaticText(self, label = 'Selection')
         self.right_v_sizer.Add(self.selection_label, proportion = 0, flag = wx.EXPAND)
         self.right_v_sizer.Add((0,10))
-        self.list = wx.ListCtrl(self, wx.ID_ANY, style = wx.LC_REPORT)
+        self.list = Curve_list(self, wx.ID_ANY, fields = ['index', 'sample', 'batch', 'subbatch'], thumbnail_size = (64, 32))
         # self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_select)
-        self.list.InsertColumn(0, "Index")
-        self.list.InsertColumn(1, "Sample")
-        self.list.InsertColumn(2, "Batch")
-        self.list.InsertColumn(3, "Subbatch")
         self.right_v_sizer.Add(self.list, proportion = 1, flag = wx.EXPAND)
         self.right_v_sizer.Add((0,10))
         self.redraw_button = wx.Button(self, label = 'Redraw')
@@ -261,37 +603,57 @@ class Import_dialog(wx.Dialog):
         
         self.file_path = file_path
         if os.path.isfile(file_path):
-            self.table = Table(file_path)
-            self.cache.cache(self.table)
-
-        # Cleanups 
-        # self.cache.clear()
-        self.list.DeleteAllItems()
-
-        
+            self.table = open_table(file_path)
+            self.preview.reset()
+            self.preview.cache(self.table)
 
         # Construct curve list for this single cache action
         # curve_list = {}
         # for index in indices:
         #     curve_list[index] = self.cache.cached[index]
 
-        self.canvas_panel.draw(self.cache, table_id=self.table.id)
-
-        list_position = 0  # A counter for setting list index
-        for table_id, table_contents in self.cache.cached.items():
-            table_name = self.cache.lut[table_id].table_name
-            for batch, batch_contents in table_contents.items():
-                for subbatch, truncation_point in batch_contents.items():
-                    self.list.InsertItem(list_position, label = "%s %s %s" % (table_id, batch, subbatch))
-                    self.list.SetItem(list_position, 1, table_name)
-                    self.list.SetItem(list_position, 2, str(batch))
-                    self.list.SetItem(list_position, 3, str(subbatch))
-                    # self.list.SetItemPtrData(list_position, {
-                    #     "table_id": table_id,
-                    #     "batch": batch,
-                    #     "subbatch": subbatch
-                    # })
-            list_position = list_position + 1
+        self.canvas_panel.draw(self.preview, table_id=self.table.id)
+
+        # Only curves of this table can be selected
+        self.list.update(self.preview, table_id = self.table.id)
+
+        # Render thumbnails in background
+        self._thumbnail_generation += 1
+        self.list.clear_thumbnails()
+        curves = [(batch, subbatch) for batch, batch_contents in self.preview.cached.get(self.table.id, {}).items() for subbatch in batch_contents.keys()]
+        threading.Thread(target = self.render_thumbnails, args = (self._thumbnail_generation, self.table, curves), name = 'thumbnails', daemon = True).start()
+
+    def render_thumbnails(self, generation, table, curves):
+
+        '''
+            Render thumbnails of curves of a table, runs in a worker thread. Stops when thumbnails of another generation are wanted.
+        '''
+
+        width, height = self.list.thumbnail_size
+        for batch, subbatch in curves:
+            if generation != self._thumbnail_generation:
+                return
+            array = table.get_curve_data(batch, subbatch)
+            if array is None:
+                continue
+            image = render_thumbnail(array, width, height)
+            wx.CallAfter(self.show_thumbnail, generation, (table.id, batch, subbatch), image)
+
+    def show_thumbnail(self, generation, curve, image):
+
+        if generation != self._thumbnail_generation:
+            return
+        height, width = image.shape[:2]
+        self.list.set_thumbnail(curve, wx.Bitmap.FromBuffer(width, height, image))
+
+    def end_preview(self):
+
+        '''
+            Stop rendering thumbnails, and drop the preview
+        '''
+
+        self._thumbnail_generation += 1
+        self.preview.reset()
         
 
     def on_redraw_clicked(self, event):
@@ -299,12 +661,15 @@ class Import_dialog(wx.Dialog):
         print("Redraw called")
         selection = self.get_selected()
         selections_list = self.translate_index(selection)
-        self.canvas_panel.draw(self.cache, selections = selections_list)
+        # Without selection, all curves of the table are drawn
+        self.canvas_panel.draw(self.preview, table_id = self.table.id, selections = selections_list)
 
     def get_selected(self):
 
         count = self.list.GetFirstSelected()
         selected = []
+        if count == -1:
+            return selected
         selected.append(count)
         while True:
             next_selection = self.list.GetNextSelected(count)
@@ -321,10 +686,11 @@ class Import_dialog(wx.Dialog):
 
         info_list = []
         for position in position_list:
+            table_id, batch, subbatch = self.list.curve_at(position)
             info = {
-                'table_id': self.list.GetItemText(position, col=0).split(' ')[0],
-                'batch': int(self.list.GetItemText(position, col=0).split(' ')[1]),
-                'subbatch': int(self.list.GetItemText(position, col=0).split(' ')[2])}
+                'table_id': table_id,
+                'batch': batch,
+                'subbatch': subbatch}
             print(info)
             info_list.append(info)
 
@@ -333,19 +699,18 @@ class Import_dialog(wx.Dialog):
     def on_ok_clicked(self, event):
 
         '''
-            On OK button clicked, revert the previous caching action, then cache the selected curves
+            On OK button clicked, cache the selected curves to the main cache. If nothing is selected, all curves of the table are cached.
         '''
 
         # Construct selection for Curve_cache.cache() for next caching action
         selected = self.translate_index(self.get_selected())    # List of selected curves
-        selections = []  # Selection for Curve_cache.cache()
-        for selection in selected:  # 
-            selections.append((selection['batch'], selection['subbatch']))
+        selections = None  # Selection for Curve_cache.cache()
+        if selected != []:
+            selections = []
+            for selection in selected:  # 
+                selections.append((selection['batch'], selection['subbatch']))
 
-        # Revert the previous action (made by self.set_file_path())
-        self.cache.undo()
-
-        # Cache selected curves
+        # Commit the selection in one step, the preview never enters the main cache
         self.cache.cache(self.table, selections = selections)
 
         self.EndModal(0)
@@ -377,6 +742,9 @@ class Plot_settings_dialog(wx.Dialog):
         lr_hbox.Add(self.lr_start, flag = wx.EXPAND|wx.ALL, border = 10)
         lr_hbox.Add(wx.StaticText(self, label = 'End: '), flag = wx.EXPAND|wx.ALL, border = 10)
         lr_hbox.Add(self.lr_end, flag = wx.EXPAND|wx.ALL, border = 10)
+
+        self.lr_auto = wx.CheckBox(self, label = 'Find the most linear regression window automatically')
+        self.lr_auto.SetValue(config.config["regression"].get("auto", False))
         
 
         operations_hbox = wx.BoxSizer(wx.HORIZONTAL)
@@ -390,6 +758,7 @@ class Plot_settings_dialog(wx.Dialog):
 
         main_vbox.Add(y_unit_hbox, flag = wx.EXPAND)
         main_vbox.Add(lr_hbox, flag = wx.EXPAND)
+        main_vbox.Add(self.lr_auto, flag = wx.EXPAND|wx.ALL, border = 10)
         main_vbox.Add(operations_hbox, flag = wx.EXPAND)
 
         self.SetSizer(main_vbox)
@@ -432,6 +801,7 @@ class Plot_settings_dialog(wx.Dialog):
 
         config.config["regression"]["start"] = start_val
         config.config["regression"]["end"] = end_val
+        config.config["regression"]["auto"] = self.lr_auto.GetValue()
 
         # print("Unit: %s, start: %f, end: %f" % (self.y_unit_list[unit], config.config["regression"]["start"], config.config["regression"]["end"]))
         print(config.config)
@@ -495,11 +865,7 @@ class Main_window(wx.Frame):
         
         self.right_v_sizer.Add(wx.StaticText(self, label = 'Selection'), flag = wx.GROW)
         self.right_v_sizer.Add((0,10))
-        self.list = wx.ListCtrl(self, wx.ID_ANY, style = wx.LC_REPORT)
-        self.list.InsertColumn(0, "Sample")
-        self.list.InsertColumn(1, "Batch")
-        self.list.InsertColumn(2, "Subbatch")
-        self.list.InsertColumn(3, "Truncation%")
+        self.list = Curve_list(self, wx.ID_ANY, fields = ['sample', 'batch', 'subbatch', 'truncation'])
         self.right_v_sizer.Add(self.list, proportion = 1, flag = wx.GROW)
 
 
@@ -519,6 +885,13 @@ class Main_window(wx.Frame):
         self.console.write("TenTackle pre-alpha - https://github.com/Proxy305/TenTackle")
         self.console.write("Standby.")
 
+        # Slow jobs run in background, see self.run_in_background()
+        self._task = None
+        self._progress_dialog = None
+        self._progress_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_progress_timer, self._progress_timer)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
     def init_ui(self):
 
         # Menu bar
@@ -607,23 +980,70 @@ class Main_window(wx.Frame):
 
     def update_listbox(self):
 
-        self.list.DeleteAllItems()
-
-        list_position = 0
-        for table_id, table_contents in self.cache.cached.items():
-            table_name = self.cache.lut[table_id].table_name
-            for batch, batch_contents in table_contents.items():
-                for subbatch, truncation_point in batch_contents.items():
-                    self.list.InsertItem(list_position, table_name)
-                    self.list.SetItem(list_position, 1, str(batch))
-                    self.list.SetItem(list_position, 2, str(subbatch))
-                    self.list.SetItem(list_position, 3, str(0))
-                    list_position = list_position + 1  
+        self.list.update(self.cache)
         
         
     def on_quit(self, e):
         self.Close()
 
+    def on_close(self, e):
+
+        # Write pending journal entries before exiting
+        if self.cache.close() == False:
+            wx.MessageBox('Some changes could not be saved, see the console for details.', "Warning", wx.OK | wx.ICON_EXCLAMATION)
+        e.Skip()
+
+    def run_in_background(self, message, job, on_done, on_cancelled = None):
+
+        '''
+            Run a job in a Background_task, showing a progress dialog with a cancel button. Input to the main window is disabled until the job has finished or has been cancelled, while the window keeps being repainted.
+
+            message: str, message of the progress dialog
+            job, on_done, on_cancelled: see Background_task
+        '''
+
+        self._progress_dialog = wx.ProgressDialog('TenTackle', message, maximum = 100, parent = self, style = wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+        self._task = Background_task(job, on_done = lambda result: self.end_background_task(on_done, result), on_error = self.on_background_error, on_cancelled = on_cancelled)
+        self._progress_timer.Start(100)
+        self._task.start()
+
+    def on_progress_timer(self, e):
+
+        task = self._task
+        if task == None or task.finished or task.cancelled:
+            return
+
+        if task.total > 0:
+            keep_going, skip = self._progress_dialog.Update(min(int(100 * task.done / task.total), 99))
+        else:
+            keep_going, skip = self._progress_dialog.Pulse()
+
+        if keep_going == False:
+            # The job stops at its next check, and its result is dropped
+            task.cancel()
+            self.close_progress_dialog()
+            self.console.write('Cancelled.')
+
+    def close_progress_dialog(self):
+
+        self._progress_timer.Stop()
+        if self._progress_dialog != None:
+            self._progress_dialog.Destroy()
+            self._progress_dialog = None
+
+    def end_background_task(self, on_done, result):
+
+        self.close_progress_dialog()
+        self._task = None
+        on_done(result)
+
+    def on_background_error(self, error):
+
+        self.close_progress_dialog()
+        self._task = None
+        self.console.write('Error: %s' % error)
+        wx.MessageBox('Error: %s' % error, "Error", wx.OK | wx.ICON_EXCLAMATION)
+
     def on_import(self, e):
 
         # Get the file to be opened
@@ -636,11 +1056,23 @@ class Main_window(wx.Frame):
         if dialog_status == wx.ID_CANCEL:
             return
 
+        # Parse the file in background. The import dialog then finds the parsed table in the table registry.
+        self.run_in_background('Loading %s...' % os.path.basename(file_path), lambda task: open_table(file_path), lambda table: self.show_import_dialog(file_path, table))
+
+    def show_import_dialog(self, file_path, table):
+
+        '''
+            Open the import dialog for a file
+
+            table: the Table object of the file, kept referenced so it stays in the table registry until the dialog has opened it
+        '''
+
         # Set up the import dialog, and then open the dialog
         # The import dialog was not destroyed and kepted for next use
 
         self.import_dialog.set_file_path(file_path)
         status = self.import_dialog.ShowModal()
+        self.import_dialog.end_preview()
 
         # If the import dialog was closed by "OK", which means selection has been done
         if status == 0:
@@ -674,7 +1106,10 @@ class Main_window(wx.Frame):
 
     def on_info(self, e):
 
-        result_dict = self.cache.analyze()
+        self.run_in_background('Analyzing curves...', lambda task: self.cache.analyze(), self.show_analysis)
+
+    def show_analysis(self, result_dict):
+
         if result_dict != 0:
             result_str = '''Analysis result for curves in main cache:
             YM: %.3f\u00b1%.3f %s
@@ -709,7 +1144,7 @@ class Main_window(wx.Frame):
     def on_open(self, e):
 
         file_path = ''
-        file_dialog = wx.FileDialog(self, "Open snapshot .json", "", "", "Snapshot json (*.json)|*.json", wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+        file_dialog = wx.FileDialog(self, "Open project", "", "", "TenTackle project (*%s)|*%s|Snapshot json (*.json)|*.json" % (PROJECT_EXTENSION, PROJECT_EXTENSION), wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
         dialog_status = file_dialog.ShowModal()
         file_path = file_dialog.GetPath()
         file_dialog.Destroy()
@@ -717,29 +1152,53 @@ class Main_window(wx.Frame):
         if dialog_status == wx.ID_CANCEL:
             return
 
-        result = self.cache.restore_snapshot(file_path = file_path)
-        if result != -1:
+        if self.cache.is_empty() != True:
+            # It the current history stack is not empty, ask user what to do
+            reply = wx.MessageBox('The current cache is not empty!\n All unsaved data will be lost if another file is loaded.\n Press OK if you still wish to proceed.', "Warning", wx.OK | wx.CANCEL | wx.CANCEL_DEFAULT | wx.ICON_EXCLAMATION)
+            if reply != wx.OK:
+                return
 
-            if result == -2:
-                # It the current history stack is not empty, ask user what to do
-                reply = wx.MessageBox('The current cache is not empty!\n All unsaved data will be lost if another file is loaded.\n Press OK if you still wish to proceed.', "Warning", wx.CANCEL | wx.CANCEL_DEFAULT | wx.ICON_EXCLAMATION)
-                self.cache.restore_snapshot(file_path = file_path, force = True)
-            elif result == -3:
-                wx.MessageBox('You have just loaded a JSON snapshot file ', "Warning", wx.OK)
+        # Restore to a new cache in background, the current cache is kept until restoration has succeeded
+        self.run_in_background('Opening %s...' % os.path.basename(file_path), lambda task: self.restore_project(file_path, task), lambda cache: self.show_project(file_path, cache), on_cancelled = lambda cache: cache != None and cache.close())
 
-            # If no error at all
+    def restore_project(self, file_path, task):
 
-            # self.canvas.update_params({"numbering": False}) # Workaround 2021/12/27
-            self.canvas.draw(self.cache)
-            self.update_listbox()
+        '''
+            Restore a project file to a new Curve_cache, runs in a Background_task
 
-            # Set window title
-            self.SetTitle('TenTackle GUI - ' + file_path)
+            Return value: the new Curve_cache, or None if restoration has failed
+        '''
 
-            # Disable "save" menubar item
-            self.mb_save.Enable(False)
-        else:
+        # Config of the project is applied in show_project(), so cancelling leaves the current settings untouched
+        cache = Curve_cache()
+        result = cache.restore_snapshot(file_path = file_path, progress = task.report, apply_config = False)
+        if result != 0:
+            cache.close()
+            return None
+        return cache
+
+    def show_project(self, file_path, cache):
+
+        if cache == None:
             wx.MessageBox('Error occured opening file.', "Warning", wx.OK | wx.ICON_EXCLAMATION)
+            return
+
+        # Replace the current cache and settings
+        self.cache.close()
+        self.cache = cache
+        self.import_dialog.cache = cache
+        if cache.snapshot_config != None:
+            config.config = cache.snapshot_config
+
+        # self.canvas.update_params({"numbering": False}) # Workaround 2021/12/27
+        self.canvas.draw(self.cache)
+        self.update_listbox()
+
+        # Set window title
+        self.SetTitle('TenTackle GUI - ' + file_path)
+
+        # Disable "save" menubar item
+        self.mb_save.Enable(False)
 
 
     def on_save(self, e):
@@ -749,7 +1208,7 @@ class Main_window(wx.Frame):
         # To find out who is calling, save or save as?
         if e.GetId() == wx.ID_SAVEAS:      
             # If the caller is save as, then ask user where to save
-            file_dialog = wx.FileDialog(self, "Save snapshot", "", "", "TenTackle snapshot (*.json)|*.json", wx.FD_SAVE)
+            file_dialog = wx.FileDialog(self, "Save project", "", "", "TenTackle project (*%s)|*%s|Snapshot json (*.json)|*.json" % (PROJECT_EXTENSION, PROJECT_EXTENSION), wx.FD_SAVE)
             dialog_status = file_dialog.ShowModal()
             file_path = file_dialog.GetPath()
             file_dialog.Destroy()
@@ -759,6 +1218,7 @@ class Main_window(wx.Frame):
         result = self.cache.take_snapshot(file_path = file_path)
         if result == -1:
             wx.MessageBox('Error occured during saving to file.', "Warning", wx.OK | wx.ICON_EXCLAMATION)
+            return
 
         # Get the save path, then update title bar
         self.SetTitle('TenTackle GUI - ' + self.cache.working_snapshot_file)
@@ -769,7 +1229,7 @@ class Main_window(wx.Frame):
     def on_undo(self, e):
         
         result = self.cache.undo()
-        self.canvas.draw(self.cache.cached, self.cache.lut)
+        self.canvas.draw(self.cache)
         self.update_listbox()
 
         working_file_path = self.cache.working_snapshot_file
@@ -788,7 +1248,7 @@ class Main_window(wx.Frame):
     def on_redo(self, e):
         
         result = self.cache.redo()
-        self.canvas.draw(self.cache.cached, self.cache.lut)
+        self.canvas.draw(self.cache)
         self.update_listbox()
 
         working_file_path = self.cache.working_snapshot_file
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Tests of TenTackle, run with pytest
+
+import numpy as np
+
+from main import Table, load_tables
+
+
+def write_csv(path, batches = 2, subbatches = 2, rows = 200):
+
+    '''
+    Write a small .csv file in the format of Shimadzu EZ series
+    '''
+
+    lines = ['試験名,x', 'C:\\job\\test.tai', '', 'info', 'a,b', '', '試料', 'count,%d,%d' % (batches, subbatches), 'name,thickness,width,length']
+    # Dimensions of sample n are in row 3 + n of the table, so there is one more row than samples
+    for sample_number in range(batches * subbatches + 1):
+        lines.append('s%d,0.1,%.2f,20' % (sample_number, 4 + 0.1 * sample_number))
+    lines += ['', 'misc', 'm', '']
+    for sample_number in range(1, batches * subbatches + 1):
+        lines += ['sample %d' % sample_number, '時間,試験力,ストローク', 'sec,N,mm']
+        stroke = np.linspace(0, 5 + 0.1 * sample_number, rows)
+        force = 30 * (1 - np.exp(-3 * stroke))
+        lines += ['%.3f,%.5f,%.5f' % (i * 0.01, force[i], stroke[i]) for i in range(rows)]
+        lines.append('')
+
+    with open(path, 'w', encoding='Shift-JIS', newline='') as f:
+        f.write('\r\n'.join(lines) + '\r\n')
+
+
+def test_load_tables_in_worker_processes(tmp_path):
+    file_paths = []
+    for name in ('a', 'b', 'c'):
+        file_path = str(tmp_path / ('%s.csv' % name))
+        write_csv(file_path)
+        file_paths.append(file_path)
+
+    tables, errors = load_tables(file_paths, workers = 2, sidecar = False)
+
+    assert errors == {}
+    for file_path, table in zip(file_paths, tables):
+        assert isinstance(table, Table)
+        expected = Table(file_path, sidecar = False)
+        assert np.array_equal(table.get_curve_data(2, 2), expected.get_curve_data(2, 2))